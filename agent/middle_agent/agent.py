@@ -43,6 +43,11 @@ _REQUIRED_PROMPT_KEYS = ("agent_system_prompt", "worker_first_prompt_prefix", "w
 # Optional keys for planning phase (fallbacks used if missing).
 _OPTIONAL_PLANNING_KEYS = ("worker_research_prompt_prefix", "worker_plan_prompt_prefix", "agent_plan_review_instructions")
 
+# Markdown fences around Director JSON. ```json wins and runs to the last fence (the JSON may itself
+# contain fenced snippets); otherwise take the first fenced block, or everything after an unclosed fence.
+_JSON_FENCE_RE = re.compile(r"```json(.*)```|```json(.*)", re.DOTALL)
+_ANY_FENCE_RE = re.compile(r"```(?:json)?(.*?)(?:```|\Z)", re.DOTALL)
+
 
 def _load_prompts() -> Dict[str, str]:
     """Load prompts from prompts.json. Raises if file missing, invalid JSON, or required key missing."""
@@ -156,6 +161,14 @@ def _count_tokens_for_messages(messages: List[Dict[str, str]]) -> int:
         return total_chars // 4
 
 
+def _chat_content(data: Any) -> str:
+    """Return choices[0].message.content from an OpenAI-style chat completion, or "" if absent."""
+    try:
+        return data["choices"][0]["message"]["content"] or ""
+    except (KeyError, IndexError, TypeError):
+        return ""
+
+
 class AgentAPIError(Exception):
     """Raised when the agent's LLM API is unavailable or returns invalid data."""
 
@@ -367,7 +380,7 @@ class MiddleAgent:
             )
             resp.raise_for_status()
             data = resp.json()
-            content = (data.get("choices", [{}])[0].get("message", {}).get("content") or "").strip()
+            content = _chat_content(data).strip()
             if not content:
                 return fallback
             first_line = content.split("\n")[0].strip()
@@ -1363,7 +1376,7 @@ Output a single concise narrative. No JSON, no labels—just prose."""
             )
             resp.raise_for_status()
             data = resp.json()
-            return (data.get("choices", [{}])[0].get("message", {}).get("content", "") or "").strip()
+            return _chat_content(data).strip()
         except Exception as e:
             self._debug_log(f"Summarization API call failed: {e}, using truncation")
             return formatted[:4000] + "\n\n[... truncated ...]" if len(formatted) > 4000 else formatted
@@ -1540,7 +1553,7 @@ Assess: Is the ticket complete? Respond in JSON only."""
 
         try:
             data = resp.json()
-            content = data.get("choices", [{}])[0].get("message", {}).get("content", "") or ""
+            content = data["choices"][0]["message"]["content"] or ""
         except (KeyError, IndexError, TypeError) as e:
             raise AgentAPIError(
                 f"Agent API returned invalid response format: {e}",
@@ -1564,20 +1577,12 @@ Assess: Is the ticket complete? Respond in JSON only."""
             pass
         if parsed is None and "```" in content:
             # Extract JSON from markdown: prefer ```json ... ```; do not use first ``` (LLM may output other code blocks first).
-            extract = content
-            if "```json" in content:
-                start = content.find("```json") + 7
-                end = content.rfind("```")
-                if end > start:
-                    extract = content[start:end].strip()
-                else:
-                    extract = content[start:].strip()
+            m = _JSON_FENCE_RE.search(content)
+            if m:
+                extract = (m.group(1) if m.group(1) is not None else m.group(2)).strip()
             else:
-                start = content.find("```") + 3
-                if start < len(content) and content[start : start + 4] == "json":
-                    start += 4
-                end = content.find("```", start)
-                extract = content[start:end].strip() if end > 0 else content[start:].strip()
+                m = _ANY_FENCE_RE.search(content)
+                extract = m.group(1).strip() if m else content
             try:
                 parsed = json.loads(extract)
             except json.JSONDecodeError:
@@ -1602,7 +1607,8 @@ Assess: Is the ticket complete? Respond in JSON only."""
             raw_approved = parsed.get("plan_approved", False)
             response_dict["plan_approved"] = raw_approved is True or (isinstance(raw_approved, str) and raw_approved.strip().lower() == "true")
             response_dict["approved_plan_text"] = parsed.get("approved_plan_text", "") or ""
-        assistant_msg = {"role": "assistant", "content": content.strip()}
+        # content is already stripped (either the whole reply or the extracted fence body)
+        assistant_msg = {"role": "assistant", "content": content}
         updated_director = compacted + [new_user_msg, assistant_msg]
         return response_dict, updated_director
 
@@ -1645,7 +1651,7 @@ Write a short direct reply to the reviewer (2–5 sentences) that answers their
             )
             resp.raise_for_status()
             data = resp.json()
-            content = (data.get("choices", [{}])[0].get("message", {}).get("content", "") or "").strip()
+            content = _chat_content(data).strip()
             if content:
                 return content
         except Exception as e:
@@ -1779,7 +1785,7 @@ Write a clear, descriptive paragraph for the PR description explaining what was
             )
             resp.raise_for_status()
             data = resp.json()
-            content = (data.get("choices", [{}])[0].get("message", {}).get("content", "") or "").strip()
+            content = _chat_content(data).strip()
             return content if content else None
         except Exception as e:
             self._debug_log(f"PR description generation failed: {e}")
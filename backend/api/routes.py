@@ -1,25 +1,41 @@
 """
 API Routes for Terarchitect
 """
+import hashlib
+import hmac
 import json
 import os
+import random
 import re
+import signal
 import subprocess
 import threading
 import time
-from uuid import UUID, uuid5, NAMESPACE_DNS
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from uuid import UUID, uuid4, uuid5, NAMESPACE_DNS
 
 import requests
-from flask import Blueprint, current_app, jsonify, request
-from sqlalchemy import text, nullslast
-
-from models.db import db, Project, Graph, KanbanBoard, Ticket, Note, Setting, AppSetting, RAGEmbedding, ExecutionLog, PR, PRReviewComment, AgentJob
-from utils.embedding_client import embed_single
-from utils.rag import upsert_embedding, delete_embeddings_for_source
+from requests.adapters import HTTPAdapter
+from flask import Blueprint, abort, current_app, g, jsonify, request, stream_with_context
+from sqlalchemy import func, insert, select, text, nullslast, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from openai import APITimeoutError
+
+from models.db import db, Project, Graph, KanbanBoard, Ticket, Note, Setting, AppSetting, ExecutionLog, PR, PRReviewComment, AgentJob
+from utils.embedding_client import clear_query_cache, embed_query
+from utils.rag import (
+    upsert_embedding,
+    upsert_embeddings_bulk,
+    upsert_note_embedding,
+    delete_embeddings_for_sources,
+)
 from utils.app_settings import (
     get_all_for_api,
-    set_value,
-    delete_key,
+    set_values,
     ALLOWED_KEYS,
     SENSITIVE_KEYS,
     get_gh_env_for_user,
@@ -27,6 +43,7 @@ from utils.app_settings import (
     get_gh_env_for_agent,
     get_agent_env,
     get_setting_or_env,
+    get_settings_or_env,
 )
 from utils.app_settings_crypto import is_encryption_available
 
@@ -51,22 +68,54 @@ def _require_worker_auth():
     return None, None
 
 
-def _env_for_gh_user():
-    """Env for gh CLI in UI context (PR comment, approve, merge, poll). Uses stored user token and dashboard git identity if set."""
-    return {**os.environ, **get_gh_env_for_user(), **get_dashboard_git_env()}
+# (env, time.monotonic() when built). The token and git identity only change via settings PUT, which clears it;
+# the TTL bounds staleness for changes made elsewhere (e.g. env or another backend process).
+_gh_env_cache = (None, 0.0)
+_GH_ENV_TTL_SEC = 300
 
 
-# Cancel requested by ticket_id (set by UI; read by GET cancel-requested). Agent runs elsewhere (runner/container).
-_cancel_requested: dict = {}  # ticket_id (uuid) -> True
+def _env_for_gh_user():
+    """Env for gh CLI in UI context (PR comment, approve, merge, poll). Uses stored user token and dashboard git identity if set.
+    Cached for _GH_ENV_TTL_SEC; callers must not mutate the returned dict."""
+    global _gh_env_cache
+    env, built_at = _gh_env_cache
+    if env is None or time.monotonic() - built_at > _GH_ENV_TTL_SEC:
+        env = {**os.environ, **get_gh_env_for_user(), **get_dashboard_git_env()}
+        _gh_env_cache = (env, time.monotonic())
+    return env
+
+
+def _clear_gh_env_cache():
+    global _gh_env_cache, _gh_cli_token
+    _gh_env_cache = (None, 0.0)
+    _gh_cli_token = (None, 0.0)
+
+
+def _stream_json_list(items):
+    """JSON array response that serializes one element at a time, so long lists are never built as one string.
+    items must already be fetched (a list, or a generator over one): the status is fixed at 200 before iteration,
+    so nothing that can fail or hold a DB connection should run while the body streams."""
+    def generate():
+        yield "["
+        for i, item in enumerate(items):
+            yield ("," if i else "") + json.dumps(item)
+        yield "]"
+    return current_app.response_class(stream_with_context(generate()), mimetype="application/json")
+
 
 def _get_project_setting(project_id, key, default=None):
-    row = Setting.query.filter_by(project_id=project_id, key=key).first()
-    if not row:
-        return default
-    return row.value if row.value is not None else default
+    """Project setting value, read at most once per request (cached on flask.g, cleared by _set_project_setting)."""
+    cache = g.setdefault("_project_settings", {})
+    if (project_id, key) not in cache:
+        cache[(project_id, key)] = db.session.execute(
+            select(Setting.value).where(Setting.project_id == project_id, Setting.key == key)
+        ).scalar()
+    value = cache[(project_id, key)]
+    return value if value is not None else default
 
 
 def _set_project_setting(project_id, key, value):
+    g.setdefault("_project_settings", {}).pop((project_id, key), None)
     row = Setting.query.filter_by(project_id=project_id, key=key).first()
     if value is None:
         if row:
@@ -109,6 +158,24 @@ def _project_to_json(project: Project):
     }
 
 
+_DEFAULT_TICKETS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "config", "default_tickets.json")
+
+
+@lru_cache(maxsize=1)
+def _default_tickets():
+    """Default tickets for new (non-existing-repo) projects, read from config/default_tickets.json once per process.
+    Returns a tuple of dicts; empty if the file is missing or invalid."""
+    if not os.path.isfile(_DEFAULT_TICKETS_PATH):
+        return ()
+    try:
+        with open(_DEFAULT_TICKETS_PATH, encoding="utf-8") as f:
+            tickets = json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        current_app.logger.warning("Could not create default tickets: %s", e)
+        return ()
+    return tuple(t for t in tickets if isinstance(t, dict)) if isinstance(tickets, list) else ()
+
+
 @api_bp.route("/projects", methods=["GET", "POST"])
 def projects():
     """List all projects or create a new one."""
@@ -118,7 +185,10 @@ def projects():
 
     if request.method == "POST":
         data = request.json
+        # Client-side id so the graph, board and default tickets can reference it before flush:
+        # everything below is inserted in one transaction with a single commit.
         project = Project(
+            id=uuid4(),
             name=data.get("name", "Untitled Project"),
             description=data.get("description"),
             github_url=data.get("github_url"),
@@ -126,7 +196,6 @@ def projects():
             project_path=data.get("project_path"),
         )
         db.session.add(project)
-        db.session.commit()
 
         # Initialize graph and kanban board for new project
         graph = Graph(project_id=project.id)
@@ -139,33 +208,27 @@ def projects():
         kanban_board = KanbanBoard(project_id=project.id, columns=default_columns)
         db.session.add(graph)
         db.session.add(kanban_board)
-        db.session.commit()
 
         # Create default "Project setup" ticket(s) from config only for new projects (not existing repos)
         is_existing_repo = data.get("is_existing_repo") is True
-        if not is_existing_repo:
-            _config_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "config")
-            _default_tickets_path = os.path.join(_config_dir, "default_tickets.json")
-            if os.path.isfile(_default_tickets_path):
-                try:
-                    with open(_default_tickets_path, encoding="utf-8") as f:
-                        default_tickets = json.load(f)
-                    if isinstance(default_tickets, list):
-                        for t in default_tickets:
-                            ticket = Ticket(
-                                project_id=project.id,
-                                column_id="backlog",
-                                title=t.get("title", "Untitled"),
-                                description=t.get("description"),
-                                associated_node_ids=t.get("associated_node_ids", []),
-                                associated_edge_ids=t.get("associated_edge_ids", []),
-                                priority=t.get("priority", "medium"),
-                                status=t.get("status", "todo"),
-                            )
-                            db.session.add(ticket)
-                        db.session.commit()
-                except (json.JSONDecodeError, OSError) as e:
-                    current_app.logger.warning("Could not create default tickets: %s", e)
+        if not is_existing_repo and _default_tickets():
+            # Project, graph and board rows go first; the tickets are then one ORM bulk INSERT (executemany),
+            # not N unit-of-work inserts. Rows are plain dicts, so the cached config is copied, never shared.
+            db.session.flush()
+            db.session.execute(insert(Ticket), [
+                {
+                    "project_id": project.id,
+                    "column_id": "backlog",
+                    "title": t.get("title", "Untitled"),
+                    "description": t.get("description"),
+                    "associated_node_ids": list(t.get("associated_node_ids", [])),
+                    "associated_edge_ids": list(t.get("associated_edge_ids", [])),
+                    "priority": t.get("priority", "medium"),
+                    "status": t.get("status", "todo"),
+                }
+                for t in _default_tickets()
+            ])
+        db.session.commit()
 
         # Bootstrap project memory so agent retrieve has at least one doc (avoids "No facts available")
         _bootstrap_project_memory(project)
@@ -218,12 +281,17 @@ def project_detail(project_id):
         return jsonify({"message": "Project deleted"})
 
 
+@lru_cache(maxsize=65536)
+def _graph_source_id(kind, graph_id):
+    """Stable RAG source_id for a graph node/edge id. Graphs are re-saved whole, so ids repeat across saves."""
+    return uuid5(NAMESPACE_DNS, f"{kind}:{graph_id}")
+
+
 @api_bp.route("/projects/<uuid:project_id>/graph", methods=["GET", "PUT"])
 def graph(project_id):
     """Get or update the project's graph."""
-    graph = Graph.query.filter_by(project_id=project_id).first_or_404()
-
     if request.method == "GET":
+        graph = Graph.query.filter_by(project_id=project_id).first_or_404()
         return jsonify({
             "id": str(graph.id),
             "project_id": str(graph.project_id),
@@ -234,33 +302,30 @@ def graph(project_id):
 
     if request.method == "PUT":
         data = request.json
-        if "nodes" in data:
-            graph.nodes = data["nodes"] if data["nodes"] is not None else []
-        if "edges" in data:
-            graph.edges = data["edges"] if data["edges"] is not None else []
-        graph.version = graph.version + 1
+        # One UPDATE that bumps the version in SQL; the stored JSONB is never loaded just to be overwritten.
+        # RETURNING brings back only what the embedding refresh still needs (a side the body left unchanged).
+        values = {"version": Graph.version + 1}
+        returning = [Graph.version]
+        for key, column in (("nodes", Graph.nodes), ("edges", Graph.edges)):
+            if key in data:
+                values[key] = data[key] if data[key] is not None else []
+            else:
+                returning.append(column)
+        row = db.session.execute(
+            update(Graph)
+            .where(Graph.project_id == project_id)
+            .values(**values)
+            .returning(*returning)
+            .execution_options(synchronize_session=False)
+        ).mappings().first()
+        if row is None:
+            abort(404)
         db.session.commit()
 
         # RAG: replace node/edge embeddings for this project
-        current_source_ids = set()
-        nodes = graph.nodes if graph.nodes else []
-        edges = graph.edges if graph.edges else []
-        for node in nodes:
-            nid = node.get("id") or node.get("data", {}).get("id")
-            if nid is not None:
-                current_source_ids.add(uuid5(NAMESPACE_DNS, f"node:{nid}"))
-        for edge in edges:
-            eid = edge.get("id") or edge.get("data", {}).get("id")
-            if eid is not None:
-                current_source_ids.add(uuid5(NAMESPACE_DNS, f"edge:{eid}"))
-        q = RAGEmbedding.query.filter(
-            RAGEmbedding.project_id == project_id,
-            RAGEmbedding.source_type.in_(["node", "edge"]),
-        )
-        if current_source_ids:
-            q = q.filter(~RAGEmbedding.source_id.in_(list(current_source_ids)))
-        q.delete(synchronize_session=False)
-        db.session.commit()
+        nodes = (values["nodes"] if "nodes" in values else row["nodes"]) or []
+        edges = (values["edges"] if "edges" in values else row["edges"]) or []
+        items = []
         for node in nodes:
             nid = node.get("id") or node.get("data", {}).get("id")
             if nid is None:
@@ -268,7 +333,7 @@ def graph(project_id):
             label = node.get("data", {}).get("label") or node.get("label") or ""
             ntype = node.get("type") or node.get("data", {}).get("type") or ""
             content = f"{ntype} {label}".strip() or str(nid)
-            upsert_embedding(project_id, "node", uuid5(NAMESPACE_DNS, f"node:{nid}"), content)
+            items.append(("node", _graph_source_id("node", nid), content))
         for edge in edges:
             eid = edge.get("id") or edge.get("data", {}).get("id")
             if eid is None:
@@ -277,9 +342,20 @@ def graph(project_id):
             tgt = edge.get("target") or edge.get("data", {}).get("target") or ""
             label = edge.get("data", {}).get("label") or edge.get("label") or ""
             content = (f"{src} -> {tgt}" + (f" {label}" if label else "")).strip() or str(eid)
-            upsert_embedding(project_id, "edge", uuid5(NAMESPACE_DNS, f"edge:{eid}"), content)
+            items.append(("edge", _graph_source_id("edge", eid), content))
+        # Anti-join against a single uuid[] parameter instead of NOT IN (...) with one bind per node/edge,
+        # which grows with the graph and can hit the driver's parameter limit.
+        db.session.execute(
+            text(
+                "DELETE FROM rag_embeddings WHERE project_id = :pid AND source_type IN ('node', 'edge') "
+                "AND source_id <> ALL(CAST(:keep AS uuid[]))"
+            ),
+            {"pid": project_id, "keep": list({str(sid) for _, sid, _ in items})},
+        )
+        db.session.commit()
+        upsert_embeddings_bulk(project_id, items)
 
-        return jsonify({"version": graph.version})
+        return jsonify({"version": row["version"]})
 
 
 @api_bp.route("/projects/<uuid:project_id>/kanban", methods=["GET", "PUT"])
@@ -306,8 +382,9 @@ def kanban(project_id):
 def tickets(project_id):
     """List tickets or create a new one."""
     if request.method == "GET":
-        tickets = Ticket.query.filter_by(project_id=project_id).all()
-        return jsonify([_ticket_to_json(t) for t in tickets])
+        # joinedload: _ticket_to_json reads t.pr, which would otherwise lazy-load once per ticket
+        tickets = Ticket.query.options(joinedload(Ticket.pr)).filter_by(project_id=project_id).all()
+        return _stream_json_list(_ticket_to_json(t) for t in tickets)
 
     if request.method == "POST":
         data = request.json or {}
@@ -333,13 +410,18 @@ def tickets(project_id):
 
 def _enqueue_ticket_job(ticket_id):
     """Enqueue a ticket job to agent_jobs. Skip if project missing URL/path for mode or already pending/running."""
-    ticket = Ticket.query.get(ticket_id)
-    if not ticket:
+    # Only the columns the checks need; the ticket row itself is touched with a single UPDATE below.
+    project_id = db.session.query(Ticket.project_id).filter_by(id=ticket_id).scalar()
+    if not project_id:
         return
-    project = Project.query.get(ticket.project_id)
+    project = (
+        db.session.query(Project.execution_mode, Project.github_url, Project.project_path)
+        .filter_by(id=project_id)
+        .first()
+    )
     if not project:
         return
-    execution_mode = getattr(project, "execution_mode", None) or "docker"
+    execution_mode = project.execution_mode or "docker"
     if execution_mode == "local":
         if not (project.project_path or "").strip():
             current_app.logger.info("Skipping enqueue: ticket %s project is local but has no project path", ticket_id)
@@ -348,37 +430,123 @@ def _enqueue_ticket_job(ticket_id):
         if not (project.github_url or "").strip():
             current_app.logger.info("Skipping enqueue: ticket %s project has no GitHub URL", ticket_id)
             return
-    existing = AgentJob.query.filter(
-        AgentJob.ticket_id == ticket_id,
-        AgentJob.status.in_(["pending", "running"]),
-    ).first()
-    if existing:
-        current_app.logger.info("Skipping enqueue: ticket %s already has job %s", ticket_id, existing.id)
+    existing_id = (
+        db.session.query(AgentJob.id)
+        .filter(AgentJob.ticket_id == ticket_id, AgentJob.status.in_(["pending", "running"]))
+        .limit(1)
+        .scalar()
+    )
+    if existing_id:
+        current_app.logger.info("Skipping enqueue: ticket %s already has job %s", ticket_id, existing_id)
         return
     db.session.add(AgentJob(
         ticket_id=ticket_id,
-        project_id=ticket.project_id,
+        project_id=project_id,
         kind="ticket",
         status="pending",
     ))
-    db.session.commit()
+    # A cancel applies to the previous run, not this one
+    Ticket.query.filter_by(id=ticket_id).update({"cancel_requested_at": None}, synchronize_session=False)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Lost a race with another enqueue: _agent_job_active_uniq already holds an active job
+        db.session.rollback()
+        current_app.logger.info("Skipping enqueue: ticket %s already has an active job", ticket_id)
+        return
     current_app.logger.info("Enqueued ticket job for ticket %s", ticket_id)
 
 
+# Hourly reconcile when GitHub webhooks (GITHUB_WEBHOOK_SECRET) deliver review activity as it happens.
+_PR_RECONCILE_SECONDS = 3600
+
+
+# Postgres advisory lock key for the PR poll leader. Every backend process (e.g. gunicorn workers) starts the
+# loop; only the one holding this lock polls, and it is released when that process's connection closes.
+_PR_POLL_LOCK_KEY = 0x7465726150522B  # "teraPR+"
+
+
 def _run_pr_poll_loop(app, pr_poll_seconds=60):
-    """Background thread: run PR review comment poll; new comments enqueue to agent_jobs. No in-process agent run."""
+    """Background thread: run PR review comment poll; new comments enqueue to agent_jobs. No in-process agent run.
+    With a webhook secret configured the poll is only a reconciler for missed deliveries and runs hourly.
+    Sleeps carry up to 10% jitter, and only the process holding the poll advisory lock polls."""
+    lock_conn = None  # dedicated connection that holds the session-level advisory lock once acquired
     while True:
-        time.sleep(pr_poll_seconds)
         try:
             with app.app_context():
+                webhooks = bool(get_setting_or_env("GITHUB_WEBHOOK_SECRET"))
+        except Exception:
+            webhooks = False
+        interval = max(pr_poll_seconds, _PR_RECONCILE_SECONDS) if webhooks else pr_poll_seconds
+        time.sleep(interval * random.uniform(0.9, 1.1))
+        try:
+            with app.app_context():
+                if lock_conn is not None:
+                    try:
+                        lock_conn.execute(text("SELECT 1"))
+                        lock_conn.commit()
+                    except Exception:
+                        # Lost the connection (and with it the lock): compete for it again
+                        lock_conn.close()
+                        lock_conn = None
+                if lock_conn is None:
+                    conn = db.engine.connect()
+                    if conn.execute(select(func.pg_try_advisory_lock(_PR_POLL_LOCK_KEY))).scalar():
+                        conn.commit()
+                        lock_conn = conn
+                        app.logger.info("PR review poller: this process is the poll leader")
+                    else:
+                        conn.close()
+                        continue
                 _poll_pr_review_comments()
         except Exception as e:
             if app:
                 app.logger.exception("PR review poller error: %s", e)
 
 
+# Webhook refreshes run on a small shared pool rather than a thread per delivery; a PR already waiting for a
+# refresh is not queued twice (GitHub sends bursts of events for one review).
+_pr_refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pr-refresh")
+_pr_refresh_pending: set = set()
+_pr_refresh_lock = threading.Lock()
+
+
+def _poll_single_pr_async(app, slug, pr_number):
+    """Webhook follow-up: refresh one PR in the background so the delivery is acknowledged immediately."""
+    key = (slug, pr_number)
+    with _pr_refresh_lock:
+        if key in _pr_refresh_pending:
+            return
+        _pr_refresh_pending.add(key)
+
+    def run():
+        # Leave the pending set before polling, so a delivery arriving mid-refresh queues a fresh one
+        with _pr_refresh_lock:
+            _pr_refresh_pending.discard(key)
+        try:
+            with app.app_context():
+                _poll_pr_review_comments(only=key)
+        except Exception as e:
+            app.logger.exception("PR webhook refresh error for %s#%s: %s", slug, pr_number, e)
+    _pr_refresh_pool.submit(run)
+
+
+# Plain ticket fields PATCH may set directly.
+_TICKET_PATCH_FIELDS = (
+    "column_id", "title", "description", "priority", "status", "associated_node_ids", "associated_edge_ids",
+)
+
+
 def _ticket_to_json(t):
-    out = {
+    # Each attribute read once: list endpoints call this per ticket, and t.pr is an instrumented relationship
+    pr = t.pr
+    return _ticket_fields_to_json(t, pr.pr_url if pr else None, pr.pr_number if pr else None)
+
+
+def _ticket_fields_to_json(t, pr_url, pr_number):
+    """_ticket_to_json body for a ticket or a row with the ticket's column names, with the PR fields passed in."""
+    created_at, updated_at = t.created_at, t.updated_at
+    return {
         "id": str(t.id),
         "project_id": str(t.project_id),
         "column_id": str(t.column_id),
@@ -388,22 +556,43 @@ def _ticket_to_json(t):
         "associated_edge_ids": t.associated_edge_ids,
         "priority": t.priority,
         "status": t.status,
-        "created_at": t.created_at.isoformat() if t.created_at else None,
-        "updated_at": t.updated_at.isoformat() if t.updated_at else None,
+        "created_at": created_at.isoformat() if created_at else None,
+        "updated_at": updated_at.isoformat() if updated_at else None,
+        "pr_url": pr_url,
+        "pr_number": pr_number,
     }
-    if t.pr:
-        out["pr_url"] = t.pr.pr_url
-        out["pr_number"] = t.pr.pr_number
-    else:
-        out["pr_url"] = None
-        out["pr_number"] = None
-    return out
 
 
 @api_bp.route("/projects/<uuid:project_id>/tickets/<uuid:ticket_id>", methods=["GET", "PATCH", "DELETE"])
 def ticket_detail(project_id, ticket_id):
     """Get, update, or delete a single ticket."""
-    ticket = Ticket.query.filter_by(project_id=project_id, id=ticket_id).first_or_404()
+    if request.method == "PATCH" and (request.json or {}).get("column_id") != "in_progress":
+        # Nothing to validate unless the ticket moves to In Progress: one statement, no SELECT first and no lazy
+        # t.pr load: WITH upd AS (UPDATE ... RETURNING ...) SELECT upd.*, prs.pr_url, prs.pr_number LEFT JOIN prs.
+        data = request.json or {}
+        changed = {k: data[k] for k in _TICKET_PATCH_FIELDS if k in data}
+        if changed:
+            upd = (
+                update(Ticket)
+                .where(Ticket.project_id == project_id, Ticket.id == ticket_id)
+                .values(**changed)
+                .returning(*Ticket.__table__.c)
+                .cte("upd")
+            )
+            row = db.session.execute(
+                select(upd, PR.pr_url, PR.pr_number).outerjoin(PR, PR.ticket_id == upd.c.id)
+            ).first()
+            if row is None:
+                abort(404)
+            out = _ticket_fields_to_json(row, row.pr_url, row.pr_number)
+            db.session.commit()
+            if "title" in changed or "description" in changed:
+                content = ((out["title"] or "") + " " + (out["description"] or "")).strip()
+                if content:
+                    upsert_embedding(project_id, "ticket", ticket_id, content)
+            return jsonify(out)
+
+    ticket = Ticket.query.options(joinedload(Ticket.pr)).filter_by(project_id=project_id, id=ticket_id).first_or_404()
 
     if request.method == "GET":
         return jsonify(_ticket_to_json(ticket))
@@ -452,17 +641,20 @@ def ticket_detail(project_id, ticket_id):
         if "associated_edge_ids" in data:
             ticket.associated_edge_ids = data["associated_edge_ids"]
         db.session.commit()
-        content = ((ticket.title or "") + " " + (ticket.description or "")).strip()
-        if content:
-            upsert_embedding(project_id, "ticket", ticket.id, content)
+        # Column/status moves leave the embedded text alone; only title/description edits re-embed
+        if "title" in data or "description" in data:
+            content = ((ticket.title or "") + " " + (ticket.description or "")).strip()
+            if content:
+                upsert_embedding(project_id, "ticket", ticket.id, content)
         if moved_to_in_progress:
             _enqueue_ticket_job(ticket.id)
         return jsonify(_ticket_to_json(ticket))
 
     if request.method == "DELETE":
-        for c in ticket.comments:
-            delete_embeddings_for_source(project_id, "ticket_comment", c.id)
-        delete_embeddings_for_source(project_id, "ticket", ticket.id)
+        delete_embeddings_for_sources(
+            project_id,
+            [("ticket", ticket.id)] + [("ticket_comment", c.id) for c in ticket.comments],
+        )
         db.session.delete(ticket)
         db.session.commit()
         return jsonify({"message": "Ticket deleted"})
@@ -471,18 +663,27 @@ def ticket_detail(project_id, ticket_id):
 @api_bp.route("/projects/<uuid:project_id>/tickets/<uuid:ticket_id>/logs", methods=["GET"])
 def ticket_logs(project_id, ticket_id):
     """Get execution logs for a ticket (for debugging)."""
-    logs = ExecutionLog.query.filter_by(
-        project_id=project_id,
-        ticket_id=ticket_id,
-    ).order_by(ExecutionLog.created_at.asc()).all()
-    return jsonify([{
+    # Column rows (no ORM instances), fetched before the response starts; only serialization is streamed
+    logs = db.session.execute(
+        select(
+            ExecutionLog.id,
+            ExecutionLog.step,
+            ExecutionLog.summary,
+            ExecutionLog.raw_output,
+            ExecutionLog.success,
+            ExecutionLog.created_at,
+        )
+        .where(ExecutionLog.project_id == project_id, ExecutionLog.ticket_id == ticket_id)
+        .order_by(ExecutionLog.created_at.asc())
+    ).all()
+    return _stream_json_list({
         "id": str(log.id),
         "step": log.step,
         "summary": log.summary,
         "raw_output": log.raw_output,
         "success": log.success,
         "created_at": log.created_at.isoformat() if log.created_at else None,
-    } for log in logs])
+    } for log in logs)
 
 
 # Keys sent to agent in worker-context (agent/worker/memory config). Sensitive values are decrypted.
@@ -514,7 +715,8 @@ def worker_context(project_id, ticket_id):
     context.pop("project_path", None)
     context["repo_url"] = project.github_url or ""
     context["project_id"] = str(project_id)
-    context["agent_settings"] = {k: (get_setting_or_env(k) or "") for k in _AGENT_SETTINGS_KEYS}
+    settings = get_settings_or_env(_AGENT_SETTINGS_KEYS)
+    context["agent_settings"] = {k: (settings[k] or "") for k in _AGENT_SETTINGS_KEYS}
     return jsonify(context)
 
 
@@ -588,8 +790,26 @@ def ticket_cancel_requested(project_id, ticket_id):
     err, status = _require_worker_auth()
     if err is not None:
         return err, status
-    Ticket.query.filter_by(project_id=project_id, id=ticket_id).first_or_404()
-    return jsonify({"cancel_requested": _cancel_requested.get(ticket_id) is True})
+    row = db.session.execute(
+        select(Ticket.cancel_requested_at).where(Ticket.project_id == project_id, Ticket.id == ticket_id)
+    ).first()
+    if row is None:
+        return jsonify({"error": "Ticket not found"}), 404
+    return jsonify({"cancel_requested": row.cancel_requested_at is not None})
+
+
+# Quick-review data for one PR; commit message is the full message (headline is truncated by GitHub).
+_REVIEW_PR_QUERY = """
+query($owner: String!, $name: String!, $number: Int!) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      state merged body
+      commits(first: 100) { nodes { commit { oid message } } }
+      comments(first: 100) { nodes { author { login } body createdAt } }
+    }
+  }
+}
+"""
 
 
 @api_bp.route("/projects/<uuid:project_id>/tickets/<uuid:ticket_id>/review", methods=["GET"])
@@ -610,17 +830,29 @@ def ticket_review(project_id, ticket_id):
     tests_description = ""
     pr_state = "unknown"
     merged = False
-    try:
-        r_pr = subprocess.run(
-            ["gh", "api", f"repos/{slug}/pulls/{pr_row.pr_number}"],
-            capture_output=True,
-            text=True,
-            timeout=15,
-            env=_env_for_gh_user(),
+    token = _gh_token(_env_for_gh_user())
+    owner, _, name = slug.partition("/")
+    # PR, commits and comments in one GraphQL round trip. GraphQL has no file patches (needed for test names),
+    # so the files list comes from REST, fetched concurrently over the shared GitHub session.
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        f_pr = pool.submit(
+            _gh_graphql, _REVIEW_PR_QUERY, token, {"owner": owner, "name": name, "number": pr_row.pr_number}, 15
         )
-        if r_pr.returncode == 0 and r_pr.stdout:
-            pr_data = json.loads(r_pr.stdout)
-            pr_state = pr_data.get("state") or "unknown"
+        f_files = pool.submit(_gh_get, f"repos/{slug}/pulls/{pr_row.pr_number}/files", token, {"per_page": 100}, 15)
+
+    def result(future):
+        """Response JSON, or None when GitHub answered with an error status (that section is left empty)."""
+        try:
+            return future.result()
+        except requests.HTTPError:
+            return None
+
+    comments = []
+    try:
+        pr_data = ((result(f_pr) or {}).get("repository") or {}).get("pullRequest")
+        if isinstance(pr_data, dict):
+            # REST spelling: merged PRs are "closed"
+            pr_state = "open" if pr_data.get("state") == "OPEN" else "closed"
             merged = bool(pr_data.get("merged"))
             body = (pr_data.get("body") or "").strip()
             if "## What was accomplished" in body:
@@ -630,61 +862,34 @@ def ticket_review(project_id, ticket_id):
                 summary = part.strip()
             else:
                 summary = body or "No description."
+        else:
+            pr_data = {}
 
-        r_commits = subprocess.run(
-            ["gh", "api", f"repos/{slug}/pulls/{pr_row.pr_number}/commits"],
-            capture_output=True,
-            text=True,
-            timeout=15,
-            env=_env_for_gh_user(),
-        )
-        if r_commits.returncode == 0 and r_commits.stdout:
-            raw = json.loads(r_commits.stdout)
-            list_commits = raw if isinstance(raw, list) else []
-            for c in list_commits:
-                sha = (c.get("sha") or "")[:7]
-                msg = (c.get("commit") or {}).get("message") or ""
-                if msg and "\n" in msg:
-                    msg = msg.split("\n")[0]
-                commits.append({"sha": sha, "message": msg.strip()})
+        for node in (pr_data.get("commits") or {}).get("nodes") or []:
+            c = node.get("commit") or {}
+            sha = (c.get("oid") or "")[:7]
+            msg = c.get("message") or ""
+            if msg and "\n" in msg:
+                msg = msg.split("\n")[0]
+            commits.append({"sha": sha, "message": msg.strip()})
 
         # Test files: only those changed/added in this PR (from GitHub PR files API)
-        r_files = subprocess.run(
-            ["gh", "api", f"repos/{slug}/pulls/{pr_row.pr_number}/files"],
-            capture_output=True,
-            text=True,
-            timeout=15,
-            env=_env_for_gh_user(),
-        )
-        if r_files.returncode == 0 and r_files.stdout:
-            files_data = json.loads(r_files.stdout)
-            files_list = files_data if isinstance(files_data, list) else []
-            for f in files_list:
-                path = (f.get("filename") or "").strip()
-                if not _is_test_file(path):
-                    continue
-                patch = f.get("patch") or ""
-                names = _extract_test_names_from_patch(patch)
-                test_files.append({"path": path, "test_names": names})
+        files_list = result(f_files)
+        for f in files_list if isinstance(files_list, list) else []:
+            path = (f.get("filename") or "").strip()
+            if not _is_test_file(path):
+                continue
+            patch = f.get("patch") or ""
+            names = _extract_test_names_from_patch(patch)
+            test_files.append({"path": path, "test_names": names})
         test_files.sort(key=lambda x: (x["path"].replace("\\", "/").lower(), x["path"]))
 
-        comments = []
-        r_comments = subprocess.run(
-            ["gh", "api", f"repos/{slug}/issues/{pr_row.pr_number}/comments"],
-            capture_output=True,
-            text=True,
-            timeout=15,
-            env=_env_for_gh_user(),
-        )
-        if r_comments.returncode == 0 and r_comments.stdout:
-            raw_comments = json.loads(r_comments.stdout)
-            list_comments = raw_comments if isinstance(raw_comments, list) else []
-            for c in list_comments:
-                author = (c.get("user") or {}).get("login") or "unknown"
-                body = (c.get("body") or "").strip()
-                created_at = c.get("created_at")
-                comments.append({"author": author, "body": body, "created_at": created_at})
-    except (subprocess.TimeoutExpired, FileNotFoundError, json.JSONDecodeError) as e:
+        for c in (pr_data.get("comments") or {}).get("nodes") or []:
+            author = (c.get("author") or {}).get("login") or "unknown"
+            body = (c.get("body") or "").strip()
+            created_at = c.get("createdAt")
+            comments.append({"author": author, "body": body, "created_at": created_at})
+    except (requests.RequestException, ValueError) as e:
         current_app.logger.warning("Review fetch failed: %s", e)
         return jsonify({"error": "Failed to fetch PR from GitHub", "detail": str(e)}), 502
 
@@ -704,65 +909,80 @@ def ticket_review(project_id, ticket_id):
 @api_bp.route("/projects/<uuid:project_id>/review", methods=["GET"])
 def project_review_list(project_id):
     """List up to 20 most recent tickets that have a PR, pending first. With PR status from GitHub."""
-    project = Project.query.get_or_404(project_id)
-    slug = _repo_slug_from_github_url(project.github_url)
-    prs = list(
-        db.session.query(PR, Ticket)
+    github_url = db.session.execute(select(Project.github_url).where(Project.id == project_id)).first()
+    if github_url is None:
+        abort(404)
+    slug = _repo_slug_from_github_url(github_url[0])
+    # One query for the listed columns only: rows are plain tuples, so nothing here can lazy-load per PR
+    prs = db.session.execute(
+        select(PR.pr_number, PR.pr_url, PR.created_at, Ticket.id.label("ticket_id"), Ticket.title)
         .join(Ticket, Ticket.id == PR.ticket_id)
-        .filter(PR.project_id == project_id)
-        .filter(PR.pr_number.isnot(None))
+        .where(PR.project_id == project_id, PR.pr_number.isnot(None))
         .order_by(PR.created_at.desc())
         .limit(50)
-        .all()
-    )
-    out = []
-    for pr_row, ticket in prs:
+    ).all()
+    # PR states in one aliased GraphQL request; PRs it misses fall back to concurrent REST reads over the shared
+    # session. PRs already seen merged need no request.
+    states = {}
+    pending = sorted({p.pr_number for p in prs if (slug, p.pr_number) not in _merged_prs}) if slug else []
+    if pending:
+        token = _gh_token(_env_for_gh_user())
+        states = _fetch_pr_states_graphql(slug, pending, token, current_app.logger)
+        missed = [n for n in pending if n not in states]
+
+        def pr_state(pr_number):
+            try:
+                data = _gh_get(f"repos/{slug}/pulls/{pr_number}", token, timeout=10)
+            except (requests.RequestException, ValueError):
+                return "unknown", False
+            return (data.get("state") or "unknown"), bool(data.get("merged"))
+
+        if missed:
+            with ThreadPoolExecutor(max_workers=min(_PR_POLL_MAX_WORKERS, len(missed))) as pool:
+                states.update(zip(missed, pool.map(pr_state, missed)))
+        _mark_merged((slug, n) for n, (_, merged) in states.items() if merged)
+    rows = []
+    for pr_row in prs:
         pr_state = "unknown"
         merged = False
-        if slug:
-            try:
-                r = subprocess.run(
-                    ["gh", "api", f"repos/{slug}/pulls/{pr_row.pr_number}"],
-                    capture_output=True,
-                    text=True,
-                    timeout=10,
-                    env=_env_for_gh_user(),
-                )
-                if r.returncode == 0 and r.stdout:
-                    data = json.loads(r.stdout)
-                    pr_state = data.get("state") or "unknown"
-                    merged = bool(data.get("merged"))
-            except (subprocess.TimeoutExpired, FileNotFoundError, json.JSONDecodeError):
-                pass
+        if slug and (slug, pr_row.pr_number) in _merged_prs:
+            pr_state, merged = "closed", True
+        elif pr_row.pr_number in states:
+            pr_state, merged = states[pr_row.pr_number]
+        # Exclude closed PRs that were not merged (e.g. abandoned or closed without merge)
+        if pr_state == "closed" and not merged:
+            continue
         created = pr_row.created_at
         ts = created.timestamp() if created else 0
-        out.append({
-            "id": str(ticket.id),
-            "title": ticket.title,
+        # Pending (open) first, then by most recent; the sort key rides alongside the payload, not inside it
+        rows.append(((merged, -ts), {
+            "id": str(pr_row.ticket_id),
+            "title": pr_row.title,
             "pr_url": pr_row.pr_url,
             "pr_number": pr_row.pr_number,
             "pr_state": pr_state,
             "merged": merged,
-            "_sort_ts": ts,
-        })
-    # Exclude closed PRs that were not merged (e.g. abandoned or closed without merge)
-    out = [x for x in out if not (x["pr_state"] == "closed" and not x["merged"])]
-    # Pending (open) first, then by most recent
-    out.sort(key=lambda x: (x["merged"], -x["_sort_ts"]))
-    for item in out:
-        del item["_sort_ts"]
-    return jsonify(out[:20])
+        }))
+    rows.sort(key=lambda r: r[0])
+    return jsonify([payload for _, payload in rows[:20]])
 
 
 def _get_ticket_pr_slug(project_id, ticket_id):
-    """Return (pr_row, slug) for ticket's PR, or (None, None). 404 if ticket/project missing."""
-    ticket = Ticket.query.filter_by(project_id=project_id, id=ticket_id).first_or_404()
-    project = Project.query.get_or_404(project_id)
-    pr_row = PR.query.filter_by(ticket_id=ticket.id).first()
-    if not pr_row or not pr_row.pr_number:
+    """Return (pr_row, slug) for ticket's PR, or (None, None). 404 if ticket/project missing.
+    pr_row is a column row (pr_number) from one ticket/project/PR join."""
+    pr_row = db.session.execute(
+        select(PR.pr_number, Project.github_url)
+        .select_from(Ticket)
+        .join(Project, Project.id == Ticket.project_id)
+        .outerjoin(PR, PR.ticket_id == Ticket.id)
+        .where(Ticket.project_id == project_id, Ticket.id == ticket_id)
+        .limit(1)
+    ).first()
+    if pr_row is None:
+        abort(404)
+    if not pr_row.pr_number:
         return None, None
-    slug = _repo_slug_from_github_url(project.github_url)
-    return pr_row, slug
+    return pr_row, _repo_slug_from_github_url(pr_row.github_url)
 
 
 @api_bp.route("/projects/<uuid:project_id>/tickets/<uuid:ticket_id>/review/comment", methods=["POST"])
@@ -777,18 +997,11 @@ def ticket_review_comment(project_id, ticket_id):
         return jsonify({"error": "body is required"}), 400
     if len(body) > 60000:
         body = body[:59997] + "..."
-    try:
-        r = subprocess.run(
-            ["gh", "pr", "comment", str(pr_row.pr_number), "--body", body, "-R", slug],
-            capture_output=True,
-            text=True,
-            timeout=30,
-            env=_env_for_gh_user(),
-        )
-        if r.returncode != 0:
-            return jsonify({"error": "Failed to post comment", "detail": (r.stderr or "").strip()}), 502
-    except (subprocess.TimeoutExpired, FileNotFoundError) as e:
-        return jsonify({"error": "Failed to post comment", "detail": str(e)}), 502
+    ok, detail = _gh_send(
+        "POST", f"repos/{slug}/issues/{pr_row.pr_number}/comments", _gh_token(_env_for_gh_user()), {"body": body}
+    )
+    if not ok:
+        return jsonify({"error": "Failed to post comment", "detail": detail}), 502
     return jsonify({"message": "Comment posted"})
 
 
@@ -800,15 +1013,12 @@ def ticket_review_approve(project_id, ticket_id):
         return jsonify({"error": "No PR for this ticket"}), 404
     data = request.json or {}
     body = (data.get("body") or "").strip()
-    try:
-        args = ["gh", "pr", "review", str(pr_row.pr_number), "--approve", "-R", slug]
-        if body:
-            args.extend(["--body", body[:60000]])
-        r = subprocess.run(args, capture_output=True, text=True, timeout=30, env=_env_for_gh_user())
-        if r.returncode != 0:
-            return jsonify({"error": "Failed to approve", "detail": (r.stderr or "").strip()}), 502
-    except (subprocess.TimeoutExpired, FileNotFoundError) as e:
-        return jsonify({"error": "Failed to approve", "detail": str(e)}), 502
+    payload = {"event": "APPROVE"}
+    if body:
+        payload["body"] = body[:60000]
+    ok, detail = _gh_send("POST", f"repos/{slug}/pulls/{pr_row.pr_number}/reviews", _gh_token(_env_for_gh_user()), payload)
+    if not ok:
+        return jsonify({"error": "Failed to approve", "detail": detail}), 502
     return jsonify({"message": "PR approved"})
 
 
@@ -822,34 +1032,31 @@ def ticket_review_merge(project_id, ticket_id):
     method = (data.get("merge_method") or "merge").strip().lower()
     if method not in ("merge", "squash", "rebase"):
         method = "merge"
-    try:
-        flag = "--merge" if method == "merge" else "--squash" if method == "squash" else "--rebase"
-        r = subprocess.run(
-            ["gh", "pr", "merge", str(pr_row.pr_number), flag, "-R", slug],
-            capture_output=True,
-            text=True,
-            timeout=30,
-            env=_env_for_gh_user(),
-        )
-        if r.returncode != 0:
-            return jsonify({"error": "Failed to merge", "detail": (r.stderr or "").strip()}), 502
-    except (subprocess.TimeoutExpired, FileNotFoundError) as e:
-        return jsonify({"error": "Failed to merge", "detail": str(e)}), 502
+    ok, detail = _gh_send(
+        "PUT", f"repos/{slug}/pulls/{pr_row.pr_number}/merge", _gh_token(_env_for_gh_user()), {"merge_method": method}
+    )
+    if not ok:
+        return jsonify({"error": "Failed to merge", "detail": detail}), 502
+    _mark_merged([(slug, pr_row.pr_number)])
     return jsonify({"message": "PR merged"})
 
 
 @api_bp.route("/projects/<uuid:project_id>/tickets/<uuid:ticket_id>/cancel", methods=["POST"])
 def cancel_ticket_execution_api(project_id, ticket_id):
     """Request cancellation. Set flag so GET cancel-requested returns true; runner/container will poll and exit."""
-    Ticket.query.filter_by(project_id=project_id, id=ticket_id).first_or_404()
-    _cancel_requested[ticket_id] = True
+    updated = Ticket.query.filter_by(project_id=project_id, id=ticket_id).update(
+        {"cancel_requested_at": func.now()}, synchronize_session=False
+    )
+    db.session.commit()
+    if not updated:
+        return jsonify({"error": "Ticket not found"}), 404
     return jsonify({"message": "Cancellation requested"}), 200
 
 
 # ---------- Phase 1: Queue (worker-facing). Auth: Bearer (TERARCHITECT_WORKER_API_KEY). ----------
 
 def _job_to_response(job):
-    """Build JSON payload for a claimed job."""
+    """Build JSON payload for a claimed job (an AgentJob or a row with the same columns)."""
     project = Project.query.get(job.project_id)
     repo_url = (project.github_url or "") if project else ""
     execution_mode = getattr(project, "execution_mode", None) or "docker" if project else "docker"
@@ -890,23 +1097,25 @@ def worker_jobs_start():
             return jsonify({"error": "project_id must be a valid UUID"}), 400
         if Project.query.get(project_id) is None:
             return jsonify({"error": "Project not found"}), 404
-        job = (
-            AgentJob.query.filter_by(project_id=project_id, status="pending")
-            .order_by(AgentJob.created_at.asc())
-            .with_for_update(skip_locked=True)
-            .first()
-        )
-    else:
-        job = (
-            AgentJob.query.filter_by(status="pending")
-            .order_by(AgentJob.created_at.asc())
-            .with_for_update(skip_locked=True)
-            .first()
+    # Claim in one statement: UPDATE ... WHERE id = (oldest pending, FOR UPDATE SKIP LOCKED) RETURNING the job.
+    # Concurrent claimers skip each other's locked row instead of waiting on it.
+    claim = select(AgentJob.id).where(AgentJob.status == "pending")
+    if project_id:
+        claim = claim.where(AgentJob.project_id == project_id)
+    claim = claim.order_by(AgentJob.created_at.asc()).limit(1).with_for_update(skip_locked=True)
+    job = db.session.execute(
+        update(AgentJob)
+        .where(AgentJob.id == claim.scalar_subquery())
+        .values(status="running")
+        .returning(
+            AgentJob.id, AgentJob.ticket_id, AgentJob.project_id, AgentJob.kind,
+            AgentJob.pr_number, AgentJob.comment_body, AgentJob.github_comment_id,
         )
+        .execution_options(synchronize_session=False)
+    ).first()
+    db.session.commit()
     if not job:
         return "", 204
-    job.status = "running"
-    db.session.commit()
     return jsonify(_job_to_response(job)), 200
 
 
@@ -949,42 +1158,36 @@ def app_settings_get():
 @api_bp.route("/settings", methods=["PUT"])
 def app_settings_put():
     """Update app settings. Body: any of ALLOWED_KEYS. Omit = no change, empty string = clear. Sensitive keys require TERARCHITECT_SECRET_KEY."""
-    import sys
     try:
         data = request.json or {}
-        print("[DEBUG] settings PUT keys in body:", list(data.keys()), file=sys.stderr, flush=True)
+        current_app.logger.debug("settings PUT keys in body: %s", list(data.keys()))
+        updates = {}
         for key in ALLOWED_KEYS:
             if key not in data:
                 continue
             val = data[key]
-            print(f"[DEBUG] processing key={key!r} val type={type(val).__name__} len={len(str(val)) if val else 0}", file=sys.stderr, flush=True)
             if val is None or (isinstance(val, str) and not val.strip()):
-                delete_key(key)
-                print(f"[DEBUG] deleted key {key}", file=sys.stderr, flush=True)
-            else:
-                plain = val if isinstance(val, str) else str(val)
-                if key in SENSITIVE_KEYS and not is_encryption_available():
-                    print("[DEBUG] 503: encryption not available for sensitive key", file=sys.stderr, flush=True)
-                    return jsonify({
-                        "error": (
-                            "TERARCHITECT_SECRET_KEY must be a 64-character hex string in .env to store secrets. "
-                            "Generate one with: python3 -c \"import secrets; print(secrets.token_hex(32))\""
-                        )
-                    }), 503
-                ok = set_value(key, plain)
-                print(f"[DEBUG] set_value({key!r}) -> {ok}", file=sys.stderr, flush=True)
-                if not ok:
-                    return jsonify({"error": f"Failed to save {key}"}), 500
-        print("[DEBUG] calling get_all_for_api()", file=sys.stderr, flush=True)
-        out = get_all_for_api()
-        print("[DEBUG] settings PUT success", file=sys.stderr, flush=True)
-        return jsonify(out)
+                updates[key] = None
+                continue
+            if key in SENSITIVE_KEYS and not is_encryption_available():
+                return jsonify({
+                    "error": (
+                        "TERARCHITECT_SECRET_KEY must be a 64-character hex string in .env to store secrets. "
+                        "Generate one with: python3 -c \"import secrets; print(secrets.token_hex(32))\""
+                    )
+                }), 503
+            updates[key] = val if isinstance(val, str) else str(val)
+        # All keys in one transaction: one DELETE for cleared keys, one upsert for the rest
+        if updates and not set_values(updates):
+            return jsonify({"error": f"Failed to save {', '.join(sorted(updates))}"}), 500
+        return jsonify(get_all_for_api())
     except Exception as e:
-        print(f"[DEBUG] settings PUT exception: {type(e).__name__}: {e}", file=sys.stderr, flush=True)
-        import traceback
-        traceback.print_exc(file=sys.stderr)
         current_app.logger.exception("Settings PUT failed: %s", e)
         return jsonify({"error": str(e)}), 500
+    finally:
+        # Token, git identity or embedding service may have changed (even on a partial save)
+        _clear_gh_env_cache()
+        clear_query_cache()
 
 
 @api_bp.route("/settings/check", methods=["GET"])
@@ -1001,15 +1204,19 @@ def app_settings_check():
 def notes(project_id):
     """List notes or create a new one."""
     if request.method == "GET":
-        notes = Note.query.filter_by(project_id=project_id).all()
+        # Column rows carry the same attribute names _note_to_json reads, without ORM instance overhead
+        notes = db.session.execute(
+            select(Note.id, Note.project_id, Note.node_id, Note.edge_id, Note.title, Note.content, Note.created_at)
+            .where(Note.project_id == project_id)
+        ).all()
         return jsonify([_note_to_json(n) for n in notes])
 
     if request.method == "POST":
         data = request.json or {}
         note = Note(
             project_id=project_id,
-            node_id=_join_note_link_ids(data.get("node_ids")),
-            edge_id=_join_note_link_ids(data.get("edge_ids")),
+            node_id=_normalize_note_link_ids(data.get("node_ids")),
+            edge_id=_normalize_note_link_ids(data.get("edge_ids")),
             title=data.get("title"),
             content=data.get("content"),
         )
@@ -1017,32 +1224,65 @@ def notes(project_id):
         db.session.commit()
         content = ((data.get("title") or "") + " " + (data.get("content") or "")).strip()
         if content:
-            upsert_embedding(project_id, "note", note.id, content)
+            _upsert_note_embedding_async(project_id, note.id, content)
         return jsonify(_note_to_json(note)), 201
 
 
-def _split_note_link_ids(raw):
-    if not raw:
-        return []
-    if isinstance(raw, list):
-        return [str(v).strip() for v in raw if str(v).strip()]
-    return [part.strip() for part in str(raw).split(",") if part.strip()]
-
-
-def _join_note_link_ids(values):
-    ids = _split_note_link_ids(values)
-    if not ids:
+def _normalize_note_link_ids(values):
+    """Request node_ids/edge_ids (list, or legacy comma-separated string) -> de-duplicated list, or None if empty."""
+    if not values:
         return None
+    if not isinstance(values, list):
+        values = str(values).split(",")
     # Preserve order while de-duplicating.
-    return ",".join(dict.fromkeys(ids))
+    ids = list(dict.fromkeys(s for s in (str(v).strip() for v in values) if s))
+    return ids or None
+
+
+# Note embeddings are refreshed off the request thread on a small shared pool. At most one refresh per note is
+# queued or running at a time: edits made meanwhile only replace the pending content, and the refresh requeues
+# itself once its write has finished, so an older text can never be written after a newer one.
+_note_embed_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="note-embed")
+_note_embed_pending: dict = {}  # (project_id, note_id) -> latest content not yet written
+_note_embed_inflight: set = set()  # (project_id, note_id) with a refresh queued or running
+_note_embed_lock = threading.Lock()
+
+
+def _upsert_note_embedding_async(project_id, note_id, content):
+    """Queue a note embedding refresh; returns immediately. upsert_note_embedding skips notes deleted meanwhile."""
+    key = (project_id, note_id)
+    with _note_embed_lock:
+        _note_embed_pending[key] = content
+        if key in _note_embed_inflight:
+            return
+        _note_embed_inflight.add(key)
+    app = current_app._get_current_object()
+
+    def run():
+        with _note_embed_lock:
+            latest = _note_embed_pending.pop(key, None)
+            if latest is None:
+                _note_embed_inflight.discard(key)  # note deleted while queued
+                return
+        try:
+            with app.app_context():
+                upsert_note_embedding(project_id, note_id, latest)
+        except Exception as e:
+            app.logger.exception("Note embedding refresh failed for %s: %s", note_id, e)
+        with _note_embed_lock:
+            if key not in _note_embed_pending:
+                _note_embed_inflight.discard(key)
+                return
+        _note_embed_pool.submit(run)  # edited during the write: embed the newer text next
+    _note_embed_pool.submit(run)
 
 
 def _note_to_json(n):
     return {
         "id": str(n.id),
         "project_id": str(n.project_id),
-        "node_ids": _split_note_link_ids(n.node_id),
-        "edge_ids": _split_note_link_ids(n.edge_id),
+        "node_ids": n.node_id or [],
+        "edge_ids": n.edge_id or [],
         "title": n.title,
         "content": n.content,
         "created_at": n.created_at.isoformat() if n.created_at else None,
@@ -1064,22 +1304,46 @@ def note_detail(project_id, note_id):
         if "content" in data:
             note.content = data["content"]
         if "node_ids" in data:
-            note.node_id = _join_note_link_ids(data.get("node_ids"))
+            note.node_id = _normalize_note_link_ids(data.get("node_ids"))
         if "edge_ids" in data:
-            note.edge_id = _join_note_link_ids(data.get("edge_ids"))
+            note.edge_id = _normalize_note_link_ids(data.get("edge_ids"))
         db.session.commit()
-        content = ((note.title or "") + " " + (note.content or "")).strip()
-        if content:
-            upsert_embedding(project_id, "note", note.id, content)
+        # Link-only edits leave the embedded text alone
+        if "title" in data or "content" in data:
+            content = ((note.title or "") + " " + (note.content or "")).strip()
+            if content:
+                _upsert_note_embedding_async(project_id, note.id, content)
         return jsonify(_note_to_json(note))
 
     if request.method == "DELETE":
-        delete_embeddings_for_source(project_id, "note", note.id)
+        with _note_embed_lock:
+            _note_embed_pending.pop((project_id, note.id), None)
+        # Note row first, then its embeddings, in one transaction (delete_embeddings_for_sources commits): a
+        # background refresh holding the note's share lock finishes first and its row is removed here.
+        note_id = note.id
         db.session.delete(note)
-        db.session.commit()
+        db.session.flush()
+        delete_embeddings_for_sources(project_id, [("note", note_id)])
         return jsonify({"message": "Note deleted"})
 
 
+# rag_search statements, built once: the same text() objects hit SQLAlchemy's compiled-statement cache each call.
+_RAG_SEARCH_SETTINGS_SQL = text("""
+    SELECT set_config('hnsw.ef_search', :ef, true),
+           (SELECT set_config('hnsw.iterative_scan', 'strict_order', true)
+            FROM pg_extension
+            WHERE extname = 'vector' AND string_to_array(extversion, '.')::int[] >= '{0,8}')
+""")
+_RAG_SEARCH_SQL = text("""
+    SELECT id, project_id, source_type, source_id, content,
+           (embedding <-> CAST(:vec AS halfvec)) AS distance
+    FROM rag_embeddings
+    WHERE project_id = :project_id AND source_type = ANY(:source_types)
+    ORDER BY distance
+    LIMIT :limit
+""")
+
+
 @api_bp.route("/rag/search", methods=["POST"])
 def rag_search():
     """Search embeddings using vector similarity (embedding service + pgvector)."""
@@ -1101,21 +1365,22 @@ def rag_search():
         return jsonify({"error": "Project not found"}), 404
 
     try:
-        query_embedding = embed_single(query)
+        query_embedding = embed_query(query)
+    except APITimeoutError as e:
+        current_app.logger.warning("Embedding service timed out: %s", e)
+        return jsonify({"error": "Embedding service timed out", "detail": str(e)}), 504
     except Exception as e:
         current_app.logger.warning("Embedding service error: %s", e)
         return jsonify({"error": "Embedding service unavailable", "detail": str(e)}), 503
 
-    vec_str = "[" + ",".join(str(f) for f in query_embedding) + "]"
+    # JSON array text is pgvector's input format; json.dumps formats the floats in C
+    vec_str = json.dumps(query_embedding, separators=(",", ":"))
+    # Transaction-local HNSW search breadth: the project/source_type filter is applied after the index scan,
+    # so search wider than limit. pgvector >= 0.8 can also keep scanning until enough rows pass the filter.
+    # Both settings go in one statement (one round trip) ahead of the search.
+    db.session.execute(_RAG_SEARCH_SETTINGS_SQL, {"ef": str(max(40, limit * 4))})
     rows = db.session.execute(
-        text("""
-            SELECT id, project_id, source_type, source_id, content,
-                   (embedding <-> CAST(:vec AS vector)) AS distance
-            FROM rag_embeddings
-            WHERE project_id = :project_id AND source_type = ANY(:source_types)
-            ORDER BY embedding <-> CAST(:vec AS vector)
-            LIMIT :limit
-        """),
+        _RAG_SEARCH_SQL,
         {"vec": vec_str, "project_id": project_uuid, "source_types": source_types, "limit": limit},
     ).fetchall()
 
@@ -1227,31 +1492,26 @@ def memory_delete(project_id):
     return jsonify({"message": "Deleted", "count": len(docs)})
 
 
+_TEST_FILE_SUFFIXES = ("_test.py", "_test.go", "_test.js")
+_TEST_FILE_MARKERS = ("__tests__", "/tests/", ".test.", ".spec.")
+# it('...'), it("..."), test('...'), test("..."), describe('...')
+_JS_TEST_NAME_RE = re.compile(r"""(?:it|test|describe)\s*\(\s*['"`]([^'"`]+)['"`]""", re.IGNORECASE)
+# def test_something( on an added line
+_PY_TEST_NAME_RE = re.compile(r"^\+\s*def\s+(test_\w+)\s*\(", re.MULTILINE)
+
+
 def _is_test_file(path):
     """True if path looks like a test file (by convention). Excludes __init__.py (package marker)."""
     if not path:
         return False
-    path_norm = path.replace("\\", "/")
-    path_lower = path_norm.lower()
-    base = path_norm.split("/")[-1] if "/" in path_norm else path_norm
-    base_lower = base.lower()
+    path_lower = path.replace("\\", "/").lower()
+    base_lower = path_lower.rsplit("/", 1)[-1]
     if base_lower == "__init__.py":
         return False
     return (
-        "__tests__" in path_lower
-        or "/tests/" in path_lower
-        or path_lower.endswith("_test.py")
+        path_lower.endswith(_TEST_FILE_SUFFIXES)
         or (base_lower.startswith("test_") and base_lower.endswith(".py"))
-        or path_lower.endswith("_test.go")
-        or path_lower.endswith("_test.js")
-        or ".test." in path_lower
-        or ".spec." in path_lower
-        or path_lower.endswith(".test.js")
-        or path_lower.endswith(".test.jsx")
-        or path_lower.endswith(".test.ts")
-        or path_lower.endswith(".test.tsx")
-        or path_lower.endswith(".spec.js")
-        or path_lower.endswith(".spec.jsx")
+        or any(marker in path_lower for marker in _TEST_FILE_MARKERS)
     )
 
 
@@ -1261,18 +1521,12 @@ def _extract_test_names_from_patch(patch):
         return []
     seen = set()
     out = []
-    # Match it('...'), it("..."), test('...'), test("..."), describe('...')
-    for m in re.finditer(
-        r"""(?:it|test|describe)\s*\(\s*['"`]([^'"`]+)['"`]""",
-        patch,
-        re.IGNORECASE,
-    ):
+    for m in _JS_TEST_NAME_RE.finditer(patch):
         name = m.group(1).strip()
         if name and name not in seen and len(name) < 200:
             seen.add(name)
             out.append(name)
-    # Match def test_something(
-    for m in re.finditer(r"^\+\s*def\s+(test_\w+)\s*\(", patch, re.MULTILINE):
+    for m in _PY_TEST_NAME_RE.finditer(patch):
         name = m.group(1).strip()
         name = name.replace("_", " ").strip()
         if name and name not in seen:
@@ -1281,16 +1535,22 @@ def _extract_test_names_from_patch(patch):
     return out
 
 
+# owner/repo after github.com in https://github.com/owner/repo[.git][/...] or git@github.com:owner/repo[.git]
+_GITHUB_SLUG_RE = re.compile(r"github\.com[:/]+([^/\s]+)/([^/\s#?]+)")
+
+
+@lru_cache(maxsize=512)
 def _repo_slug_from_github_url(url):
     """Extract owner/repo from https://github.com/owner/repo or similar. Returns None if not parseable."""
     if not url or not isinstance(url, str):
         return None
-    url = url.strip().rstrip("/")
-    if "github.com" not in url:
+    m = _GITHUB_SLUG_RE.search(url)
+    if not m:
         return None
-    path = url.split("github.com")[-1].strip("/")
-    parts = path.split("/")
-    return "/".join(parts[:2]) if len(parts) >= 2 else None
+    repo = m.group(2)
+    if repo.endswith(".git"):
+        repo = repo[:-4]
+    return f"{m.group(1)}/{repo}" if repo else None
 
 
 def _enqueue_review_job(ticket_id, comment_body, pr_number, project_id, github_comment_id):
@@ -1313,21 +1573,25 @@ def _enqueue_review_job(ticket_id, comment_body, pr_number, project_id, github_c
         comment_body=comment_body,
         github_comment_id=github_comment_id,
     ))
-    db.session.commit()
+    Ticket.query.filter_by(id=ticket_id).update({"cancel_requested_at": None}, synchronize_session=False)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        current_app.logger.info("Skipping enqueue: ticket %s PR #%s already has an active job", ticket_id, pr_number)
+        return
     current_app.logger.info("Enqueued review job for ticket %s PR #%s", ticket_id, pr_number)
 
 
 def _mark_pr_comment_addressed(project_id, pr_number, github_comment_id):
     """Mark a PR comment as addressed (we replied). Call with app context."""
-    row = PRReviewComment.query.filter_by(
+    now = datetime.utcnow()
+    updated = PRReviewComment.query.filter_by(
         project_id=project_id,
         pr_number=pr_number,
         github_comment_id=github_comment_id,
-    ).first()
-    if row:
-        from datetime import datetime
-        row.addressed_at = datetime.utcnow()
-        row.updated_at = datetime.utcnow()
+    ).update({"addressed_at": now, "updated_at": now}, synchronize_session=False)
+    if updated:
         try:
             db.session.commit()
             current_app.logger.info("Marked PR comment %s (PR #%s) as addressed", github_comment_id, pr_number)
@@ -1336,190 +1600,601 @@ def _mark_pr_comment_addressed(project_id, pr_number, github_comment_id):
 
 
 
-def _poll_pr_review_comments():
-    """Check PRs in review for new comments via gh CLI and trigger review agent for new ones. Call with app context."""
-    repo_slug = _repo_slug_from_github_url
-    # Tickets in_review with a PR
-    prs_in_review = list(
-        db.session.query(PR, Ticket, Project)
-        .join(Ticket, Ticket.id == PR.ticket_id)
-        .join(Project, Project.id == PR.project_id)
-        .filter(Ticket.column_id == "in_review")
-        .filter(Project.github_url.isnot(None))
-        .filter(PR.pr_number.isnot(None))
-        .all()
+_GH_API_URL = "https://api.github.com"
+
+# Shared by the PR poller (all worker threads): keeps TCP + TLS connections to api.github.com alive between
+# calls and polls instead of forking gh and handshaking for every request.
+_gh_http = requests.Session()
+_gh_http.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=32))
+
+# (token, time.monotonic() when read) from `gh auth token`, for when neither the stored user token nor GH_TOKEN
+# is set. Re-read after _GH_ENV_TTL_SEC, so a later `gh auth login` (or a failed first read) is picked up.
+_gh_cli_token = (None, 0.0)
+_gh_cli_token_lock = threading.Lock()
+
+# Conditional-GET validators per REST path: path -> ((path, params), etag, last_modified, payload). Only the
+# latest params per path are kept (since= moves forward), so this stays one entry per PR endpoint; beyond
+# _GH_ETAG_CACHE_MAX paths the oldest entries are dropped. Writes hold _gh_etag_lock (worker threads).
+_gh_etag_cache: dict = {}
+_gh_etag_lock = threading.Lock()
+_GH_ETAG_CACHE_MAX = 2048
+
+# time.time() until which GitHub asked us to back off (see _gh_note_rate_limit); polls are skipped until then.
+_gh_rate_limit_until = 0.0
+
+# Newest comment timestamp (GitHub ISO string) seen per (project_id, pr_number). The comment endpoints are
+# then queried with ?since= so each poll only transfers new/edited comments. Reset on restart (full fetch).
+# Full polls drop entries for PRs that are no longer awaiting review, so this tracks only open PRs.
+_pr_comment_since: dict = {}
+
+# Upper bound on PRs whose GitHub calls run at once during a poll cycle.
+_PR_POLL_MAX_WORKERS = 8
+
+# (slug, pr_number) of PRs seen merged. Merging is final, so these are never fetched from GitHub again. Kept in
+# insertion order (values unused); beyond _MERGED_PRS_MAX entries the oldest are dropped (see _mark_merged).
+_merged_prs: dict = {}
+_merged_prs_lock = threading.Lock()
+_MERGED_PRS_MAX = 4096
+
+
+def _mark_merged(keys):
+    """Record (slug, pr_number) keys as merged, evicting the oldest beyond _MERGED_PRS_MAX."""
+    with _merged_prs_lock:
+        for key in keys:
+            _merged_prs[key] = None
+        while len(_merged_prs) > _MERGED_PRS_MAX:
+            del _merged_prs[next(iter(_merged_prs))]
+
+# Serializes the background poll and webhook-triggered refreshes (shared _pr_comment_since watermarks).
+_pr_poll_lock = threading.Lock()
+
+# GitHub webhook events that can change a PR's review comments or merged/approved state.
+_GH_WEBHOOK_PR_EVENTS = frozenset({"pull_request", "pull_request_review", "pull_request_review_comment", "issue_comment"})
+
+
+def _run_gh(args, env, timeout):
+    """Run a gh command in its own process group and return (returncode, stdout). On timeout the whole group is
+    killed before TimeoutExpired is re-raised: subprocess.run only kills the direct child, and a helper it spawned
+    (e.g. a credential/keyring helper) holding the pipe open would keep the caller blocked past the timeout."""
+    proc = subprocess.Popen(
+        args,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        env=env,
+        start_new_session=True,
     )
-    if prs_in_review:
-        current_app.logger.info("PR review poll: checking %d PR(s) for new comments", len(prs_in_review))
-    for pr_row, ticket, project in prs_in_review:
-        slug = repo_slug(project.github_url)
-        if not slug:
+    try:
+        stdout, _ = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        proc.wait(timeout=5)
+        raise
+    return proc.returncode, stdout or ""
+
+
+def _gh_token(gh_env):
+    """GitHub token for direct API calls: the one gh would use from gh_env, else `gh auth token` (cached)."""
+    global _gh_cli_token
+    token = gh_env.get("GH_TOKEN") or gh_env.get("GITHUB_TOKEN")
+    if token:
+        return token
+    with _gh_cli_token_lock:
+        token, read_at = _gh_cli_token
+        if token is None or time.monotonic() - read_at > _GH_ENV_TTL_SEC:
+            try:
+                returncode, stdout = _run_gh(["gh", "auth", "token"], gh_env, timeout=10)
+                token = stdout.strip() if returncode == 0 else ""
+            except (subprocess.TimeoutExpired, FileNotFoundError):
+                token = ""
+            _gh_cli_token = (token, time.monotonic())
+        return token
+
+
+def _gh_headers(token):
+    headers = {"Accept": "application/vnd.github+json", "X-GitHub-Api-Version": "2022-11-28"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    return headers
+
+
+def _gh_note_rate_limit(resp):
+    """Record when GitHub says to back off: primary limit nearly spent (x-ratelimit-remaining < 10 -> wait for
+    x-ratelimit-reset) or a 403/429 carrying Retry-After (secondary limit). The poller skips ticks until then."""
+    global _gh_rate_limit_until
+    until = 0.0
+    remaining = resp.headers.get("X-RateLimit-Remaining")
+    if remaining is not None and remaining.isdigit() and int(remaining) < 10:
+        reset = resp.headers.get("X-RateLimit-Reset")
+        until = float(reset) if reset and reset.isdigit() else time.time() + 60
+    retry_after = resp.headers.get("Retry-After")
+    if resp.status_code in (403, 429) and retry_after and retry_after.isdigit():
+        until = max(until, time.time() + int(retry_after))
+    if until > _gh_rate_limit_until:
+        _gh_rate_limit_until = until
+
+
+def _gh_get(path, token, params=None, timeout=30, all_pages=True):
+    """GET a GitHub REST endpoint and return its JSON; list endpoints follow Link rel="next" pages and return the
+    concatenated items. all_pages=False reads only the newest items of a chronological list: the rel="last" page
+    (one extra request at most) instead of every page.
+    Sends If-None-Match/If-Modified-Since from the last single-page response for the same path and params, and on
+    304 returns that cached payload (304s are not billed against the rate limit). Multi-page results are not cached:
+    an unchanged first page says nothing about later ones.
+    Raises requests.RequestException on network or HTTP errors."""
+    cache_key = (path, tuple(sorted((params or {}).items())))
+    cached = _gh_etag_cache.get(path)
+    headers = _gh_headers(token)
+    if cached and cached[0] == cache_key:
+        if cached[1]:
+            headers["If-None-Match"] = cached[1]
+        if cached[2]:
+            headers["If-Modified-Since"] = cached[2]
+    r = _gh_http.get(f"{_GH_API_URL}/{path}", headers=headers, params=params, timeout=timeout)
+    _gh_note_rate_limit(r)
+    if r.status_code == 304 and cached:
+        return cached[3]
+    r.raise_for_status()
+    data = json.loads(r.content)
+    if not isinstance(data, list) or "next" not in r.links:
+        etag, last_modified = r.headers.get("ETag"), r.headers.get("Last-Modified")
+        if etag or last_modified:
+            with _gh_etag_lock:
+                _gh_etag_cache.pop(path, None)  # re-insert at the end: eviction is oldest-first
+                _gh_etag_cache[path] = (cache_key, etag, last_modified, data)
+                while len(_gh_etag_cache) > _GH_ETAG_CACHE_MAX:
+                    del _gh_etag_cache[next(iter(_gh_etag_cache))]
+        return data
+    with _gh_etag_lock:
+        _gh_etag_cache.pop(path, None)
+    if not all_pages:
+        url = r.links.get("last", {}).get("url")
+        if not url:
+            return data
+        page = _gh_http.get(url, headers=_gh_headers(token), timeout=timeout)
+        _gh_note_rate_limit(page)
+        page.raise_for_status()
+        return json.loads(page.content)
+    url = r.links["next"]["url"]
+    while url:
+        page = _gh_http.get(url, headers=_gh_headers(token), timeout=timeout)
+        _gh_note_rate_limit(page)
+        page.raise_for_status()
+        data.extend(json.loads(page.content))
+        url = page.links.get("next", {}).get("url")
+    return data
+
+
+def _gh_graphql(query, token, variables=None, timeout=60):
+    """POST a GraphQL query and return its "data" object ({} when absent). Errors on single fields (e.g. a deleted
+    PR) still come back as 200 with partial data. Raises requests.RequestException / ValueError on failure."""
+    r = _gh_http.post(
+        f"{_GH_API_URL}/graphql",
+        json={"query": query, "variables": variables or {}},
+        headers=_gh_headers(token),
+        timeout=timeout,
+    )
+    _gh_note_rate_limit(r)
+    r.raise_for_status()
+    body = json.loads(r.content)
+    if not isinstance(body, dict):
+        raise ValueError("unexpected GraphQL response")
+    return body.get("data") or {}
+
+
+def _gh_send(method, path, token, payload=None, timeout=30):
+    """POST/PUT a GitHub REST endpoint over the shared session. Returns (ok, detail): detail is GitHub's error
+    message on failure. Network errors are reported the same way, so callers map both to 502."""
+    try:
+        r = _gh_http.request(
+            method, f"{_GH_API_URL}/{path}", json=payload, headers=_gh_headers(token), timeout=timeout
+        )
+    except requests.RequestException as e:
+        return False, str(e)
+    _gh_note_rate_limit(r)
+    if r.ok:
+        return True, ""
+    try:
+        detail = (r.json() or {}).get("message") or r.text
+    except ValueError:
+        detail = r.text
+    return False, (detail or f"HTTP {r.status_code}").strip()
+
+
+def _rest_comment(c):
+    """REST comment/review object -> {id, body, login, created_at}. Reviews carry submitted_at instead of created_at."""
+    return {
+        "id": c.get("id"),
+        "body": c.get("body"),
+        "login": (c.get("user") or {}).get("login"),
+        "created_at": c.get("created_at") or c.get("submitted_at"),
+    }
+
+
+def _unique_comments(comments):
+    """Drop repeated ids (the same comment reached via more than one source), keeping the first of each."""
+    by_id = {}
+    for c in comments:
+        if c.get("id") is not None:
+            by_id.setdefault(c["id"], c)
+    return list(by_id.values())
+
+
+# Per-PR GraphQL selection: merged flag, then the comment sources the REST poll reads (issue comments,
+# review submissions, line comments in review threads). Ids are databaseId, which match the REST ids we store.
+_GH_PR_FIELDS = (
+    "merged "
+    "comments(last: 100) { nodes { databaseId body author { login } createdAt } } "
+    "reviews(last: 100) { nodes { databaseId state body author { login } submittedAt } } "
+    "reviewThreads(last: 50) { nodes { comments(last: 20) { nodes { databaseId body author { login } createdAt } } } }"
+)
+
+
+def _graphql_comment(node, ts_field="createdAt"):
+    """GraphQL comment node -> the {id, body, login, created_at} shape _rest_comment produces."""
+    return {
+        "id": node.get("databaseId"),
+        "body": node.get("body"),
+        "login": (node.get("author") or {}).get("login"),
+        "created_at": node.get(ts_field),
+    }
+
+
+def _fetch_prs_graphql(prs, gh_env, logger):
+    """Fetch state and comments for many (slug, pr_number) pairs with one GraphQL query.
+    Returns {(slug, pr_number): (state, raw_comments)} with state "merged" | "approved" | "open"; pairs missing
+    from the result (query failed or PR not found) should fall back to the per-PR REST calls."""
+    by_repo = {}
+    for slug, pr_number in prs:
+        by_repo.setdefault(slug, set()).add(pr_number)
+    parts = []
+    aliases = {}
+    for i, (slug, numbers) in enumerate(by_repo.items()):
+        owner, _, name = slug.partition("/")
+        fields = []
+        for n in sorted(numbers):
+            fields.append(f"p{n}: pullRequest(number: {int(n)}) {{ {_GH_PR_FIELDS} }}")
+            aliases[(f"r{i}", f"p{n}")] = (slug, n)
+        parts.append(f"r{i}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) {{ {' '.join(fields)} }}")
+    if not parts:
+        return {}
+    try:
+        data = _gh_graphql(f"query {{ {' '.join(parts)} }}", _gh_token(gh_env))
+    except (requests.RequestException, ValueError) as e:
+        logger.warning("PR poll graphql failed: %s", e)
+        return {}
+    out = {}
+    for (repo_alias, pr_alias), key in aliases.items():
+        pr = (data.get(repo_alias) or {}).get(pr_alias)
+        if not pr:
+            continue
+        reviews = (pr.get("reviews") or {}).get("nodes") or []
+        if pr.get("merged"):
+            out[key] = ("merged", [])
             continue
-        pr_number = pr_row.pr_number
+        if reviews and reviews[-1].get("state") == "APPROVED":
+            out[key] = ("approved", [])
+            continue
+        raw_comments = [_graphql_comment(c) for c in (pr.get("comments") or {}).get("nodes") or []]
+        raw_comments.extend(_graphql_comment(rv, "submittedAt") for rv in reviews)
+        for thread in (pr.get("reviewThreads") or {}).get("nodes") or []:
+            raw_comments.extend(_graphql_comment(c) for c in (thread.get("comments") or {}).get("nodes") or [])
+        out[key] = ("open", _unique_comments(raw_comments))
+    return out
 
-        # Check if PR was merged -> move ticket to done
+
+# Aliases per GraphQL request when reading PR states for the review list
+_PR_STATE_BATCH = 100
+
+
+def _fetch_pr_states_graphql(slug, pr_numbers, token, logger):
+    """State of many PRs in one repo via aliased GraphQL (one request per _PR_STATE_BATCH PRs).
+    Returns {pr_number: (state, merged)} in REST spelling ("open" | "closed"); PRs missing from the result
+    (request failed or PR not found) are left out for the caller to fetch another way."""
+    owner, _, name = slug.partition("/")
+    out = {}
+    for start in range(0, len(pr_numbers), _PR_STATE_BATCH):
+        batch = pr_numbers[start:start + _PR_STATE_BATCH]
+        fields = " ".join(f"p{int(n)}: pullRequest(number: {int(n)}) {{ state merged }}" for n in batch)
+        query = f"query {{ r: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) {{ {fields} }} }}"
         try:
-            r_pr = subprocess.run(
-                ["gh", "api", f"repos/{slug}/pulls/{pr_number}"],
-                capture_output=True,
-                text=True,
-                timeout=15,
-                env=_env_for_gh_user(),
-            )
-            if r_pr.returncode == 0 and r_pr.stdout:
-                pr_data = json.loads(r_pr.stdout)
-                if pr_data.get("merged"):
-                    ticket.column_id = "done"
-                    ticket.status = "completed"
-                    try:
-                        db.session.commit()
-                        current_app.logger.info(
-                            "PR #%s merged; moved ticket %s to done",
-                            pr_number,
-                            ticket.id,
-                        )
-                    except Exception:
-                        db.session.rollback()
-                    continue  # Skip approval check and comment processing
-        except (subprocess.TimeoutExpired, FileNotFoundError, json.JSONDecodeError):
-            pass
+            repo = _gh_graphql(query, token, timeout=15).get("r") or {}
+        except (requests.RequestException, ValueError) as e:
+            logger.warning("PR state graphql failed for %s: %s", slug, e)
+            continue
+        for n in batch:
+            pr = repo.get(f"p{int(n)}")
+            if pr:
+                out[n] = ("open" if pr.get("state") == "OPEN" else "closed", bool(pr.get("merged")))
+    return out
+
+
+def _fetch_pr_github_state(slug, pr_number, since, gh_env, logger):
+    """Read one PR's state and comments via the REST API (fallback when the GraphQL batch misses it). Returns
+    (state, raw_comments, fetched_all) where state is "merged", "approved" or "open".
+    Runs in a worker thread: no DB or app context access."""
+    token = _gh_token(gh_env)
+    comment_params = {"per_page": 100, **({"since": since} if since else {})}
+
+    # The PR, its reviews (latest state + review bodies), issue comments and line comments, fetched concurrently
+    # over the shared session. The reviews endpoint has no since filter, so only its newest page is read.
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        f_pr = pool.submit(_gh_get, f"repos/{slug}/pulls/{pr_number}", token, None, 15)
+        f_reviews = pool.submit(
+            _gh_get, f"repos/{slug}/pulls/{pr_number}/reviews", token, {"per_page": 100}, all_pages=False
+        )
+        # With a since= watermark the pages are already bounded to new comments; a cold fetch (after restart)
+        # only needs the newest page, since only the latest human comment can trigger a review.
+        f_comments = {
+            endpoint: pool.submit(_gh_get, endpoint, token, comment_params, all_pages=bool(since))
+            for endpoint in (f"repos/{slug}/issues/{pr_number}/comments", f"repos/{slug}/pulls/{pr_number}/comments")
+        }
 
-        # Check if PR was approved (latest review is APPROVED) -> move ticket to done
+    try:
+        if f_pr.result().get("merged"):
+            return "merged", [], True
+    except (requests.RequestException, ValueError):
+        pass
+    raw_comments = []
+    fetched_all = True
+    try:
+        reviews = f_reviews.result()
+        # API is chronological, so the last review is the latest
+        if reviews and reviews[-1].get("state") == "APPROVED":
+            return "approved", [], True
+        raw_comments.extend(_rest_comment(rv) for rv in reviews)
+    except (requests.RequestException, ValueError) as e:
+        logger.warning("PR poll GitHub API failed repos/%s/pulls/%s/reviews: %s", slug, pr_number, e)
+        fetched_all = False
+    for endpoint, f in f_comments.items():
         try:
-            r_reviews = subprocess.run(
-                ["gh", "api", f"repos/{slug}/pulls/{pr_number}/reviews", "--paginate"],
-                capture_output=True,
-                text=True,
-                timeout=15,
-                env=_env_for_gh_user(),
-            )
-            if r_reviews.returncode == 0 and r_reviews.stdout:
-                reviews = json.loads(r_reviews.stdout) if r_reviews.stdout else []
-                if isinstance(reviews, list) and reviews:
-                    # API returns in chronological order; last is most recent
-                    latest = reviews[-1]
-                    if latest.get("state") == "APPROVED":
-                        ticket.column_id = "done"
-                        ticket.status = "completed"
-                        try:
-                            db.session.commit()
-                            current_app.logger.info(
-                                "PR #%s approved; moved ticket %s to done",
-                                pr_number,
-                                ticket.id,
-                            )
-                        except Exception:
-                            db.session.rollback()
-                        continue  # Skip comment processing for this PR
-        except (subprocess.TimeoutExpired, FileNotFoundError, json.JSONDecodeError):
-            pass
+            raw_comments.extend(_rest_comment(c) for c in f.result())
+        except (requests.RequestException, ValueError) as e:
+            logger.warning("PR poll GitHub API failed %s: %s", endpoint, e)
+            fetched_all = False
+    return "open", _unique_comments(raw_comments), fetched_all
 
-        # Issue comments, line (review) comments, and PR review submissions (e.g. "Submit review" with body)
-        raw_comments = []
-        for endpoint in (
-            f"repos/{slug}/issues/{pr_number}/comments",
-            f"repos/{slug}/pulls/{pr_number}/comments",
-            f"repos/{slug}/pulls/{pr_number}/reviews",
-        ):
-            try:
-                r = subprocess.run(
-                    ["gh", "api", endpoint, "--paginate"],
-                    capture_output=True,
-                    text=True,
-                    timeout=30,
-                    env=_env_for_gh_user(),
-                )
-            except (subprocess.TimeoutExpired, FileNotFoundError) as e:
-                current_app.logger.warning("PR poll gh api failed %s: %s", endpoint, e)
-                continue
-            if r.returncode != 0:
-                current_app.logger.warning(
-                    "PR poll gh api non-zero %s: code=%s stderr=%s",
-                    endpoint, r.returncode, (r.stderr or "").strip()[:200],
+
+def _poll_pr_review_comments(only=None):
+    """Check PRs in review for new comments via the GitHub API and trigger review agent for new ones. Call with app context.
+    only: optional (repo slug, pr_number) to refresh just that PR (webhook deliveries)."""
+    with _pr_poll_lock:
+        _poll_pr_review_comments_locked(only)
+
+
+def _poll_pr_review_comments_locked(only):
+    if time.time() < _gh_rate_limit_until:
+        current_app.logger.warning(
+            "PR review poll: GitHub rate limited, skipping for %ds", int(_gh_rate_limit_until - time.time())
+        )
+        return
+    repo_slug = _repo_slug_from_github_url
+    # Tickets in_review with a PR: only the columns used below, not ORM instances
+    query = (
+        select(PR.pr_number, Ticket.id.label("ticket_id"), Project.id.label("project_id"), Project.github_url)
+        .join(Ticket, Ticket.id == PR.ticket_id)
+        .join(Project, Project.id == PR.project_id)
+        .where(
+            Ticket.column_id == "in_review",
+            Project.github_url.isnot(None),
+            PR.pr_number.isnot(None),
+        )
+    )
+    if only:
+        query = query.where(PR.pr_number == only[1])
+    prs_in_review = db.session.execute(query).all()
+    if not prs_in_review:
+        return
+    pending_prs = {}  # (project_id, pr_number) -> ticket_id for PRs still awaiting review
+    targets = []
+    for row in prs_in_review:
+        slug = repo_slug(row.github_url)
+        if slug and (not only or slug.lower() == only[0].lower()):
+            targets.append((row.ticket_id, row.project_id, slug, row.pr_number))
+    if not targets:
+        return
+    current_app.logger.info("PR review poll: checking %d PR(s) for new comments", len(targets))
+    gh_env = _env_for_gh_user()
+    logger = current_app.logger
+    # Merged is terminal: PRs already seen merged are not fetched again (ticket is just moved to done).
+    known = {(slug, pr_number): ("merged", []) for _, _, slug, pr_number in targets if (slug, pr_number) in _merged_prs}
+    # One GraphQL round trip for every other PR's state and comments; PRs it could not resolve fall back to REST.
+    known.update(_fetch_prs_graphql(
+        [(slug, pr_number) for _, _, slug, pr_number in targets if (slug, pr_number) not in known], gh_env, logger
+    ))
+    fallback = [t for t in targets if (t[2], t[3]) not in known]
+    fallback_results = {}
+    if fallback:
+        # GitHub calls are network waits, so PRs are fetched concurrently; DB writes stay on this thread.
+        with ThreadPoolExecutor(max_workers=min(_PR_POLL_MAX_WORKERS, len(fallback))) as pool:
+            futures = {
+                (slug, pr_number): pool.submit(
+                    _fetch_pr_github_state,
+                    slug,
+                    pr_number,
+                    _pr_comment_since.get((project_id, pr_number)),
+                    gh_env,
+                    logger,
                 )
-                continue
+                for _, project_id, slug, pr_number in fallback
+            }
+            fallback_results = {key: f.result() for key, f in futures.items()}
+    results = [
+        (*known[(slug, pr_number)], True) if (slug, pr_number) in known else fallback_results[(slug, pr_number)]
+        for _, _, slug, pr_number in targets
+    ]
+
+    # Stored comments for every open PR in one query, so comments GitHub returns unchanged (the GraphQL batch
+    # has no since filter) are not rewritten each poll.
+    open_prs = [(project_id, pr_number) for (_, project_id, _, pr_number), res in zip(targets, results) if res[0] == "open"]
+    existing = {}
+    if open_prs:
+        existing = {
+            (r.project_id, r.pr_number, r.github_comment_id): (r.body, r.author_login)
+            for r in db.session.execute(
+                select(
+                    PRReviewComment.project_id,
+                    PRReviewComment.pr_number,
+                    PRReviewComment.github_comment_id,
+                    PRReviewComment.body,
+                    PRReviewComment.author_login,
+                ).where(tuple_(PRReviewComment.project_id, PRReviewComment.pr_number).in_(open_prs))
+            )
+        }
+
+    done = []  # (pr_number, state, ticket_id) moved to done, logged once committed
+    watermarks = {}  # _pr_comment_since advances, applied once committed
+    for (ticket_id, project_id, slug, pr_number), (state, raw_comments, fetched_all) in zip(targets, results):
+        if state == "merged":
+            _mark_merged([(slug, pr_number)])
+        if state in ("merged", "approved"):
+            # Merged or approved (latest review is APPROVED) -> move ticket to done, skip comment processing
             try:
-                chunk = json.loads(r.stdout) if r.stdout else []
-            except json.JSONDecodeError:
-                continue
-            if isinstance(chunk, list):
-                raw_comments.extend(chunk)
-        # Normalize and upsert into pr_review_comments (id, body, author_login, created_at)
-        from datetime import datetime as _dt
+                with db.session.begin_nested():
+                    Ticket.query.filter_by(id=ticket_id).update(
+                        {"column_id": "done", "status": "completed"}, synchronize_session=False
+                    )
+                done.append((pr_number, state, ticket_id))
+            except Exception:
+                current_app.logger.exception("PR #%s: failed to move ticket %s to done", pr_number, ticket_id)
+            continue
+        since_key = (project_id, pr_number)
+        since = _pr_comment_since.get(since_key)
+        # Normalize and upsert into pr_review_comments (id, body, author_login, created_at): one
+        # INSERT ... ON CONFLICT per PR on the (project_id, pr_number, github_comment_id) unique constraint.
+        rows = {}  # by id; _unique_comments already dropped repeats
         for c in raw_comments:
             cid = c.get("id")
             body = (c.get("body") or "").strip()
             if cid is None or not body:
                 continue
-            author = (c.get("user") or {}).get("login")
-            created = c.get("created_at") or c.get("submitted_at")
+            if existing.get((project_id, pr_number, int(cid))) == (body, c.get("login")):
+                continue
+            created = c.get("created_at")
             try:
-                comment_ts = _dt.fromisoformat(created.replace("Z", "+00:00")) if created else None
+                # Python 3.11+ (backend image) parses GitHub's trailing "Z" natively
+                comment_ts = datetime.fromisoformat(created) if created else None
             except (ValueError, TypeError):
                 comment_ts = None
-            row = PRReviewComment.query.filter_by(
-                project_id=project.id,
-                pr_number=pr_number,
-                github_comment_id=int(cid),
-            ).first()
-            if row:
-                row.body = body
-                row.author_login = author
-                row.comment_created_at = comment_ts
-                row.updated_at = _dt.utcnow()
-            else:
-                db.session.add(PRReviewComment(
-                    project_id=project.id,
-                    ticket_id=ticket.id,
-                    pr_number=pr_number,
-                    github_comment_id=int(cid),
-                    author_login=author,
-                    body=body,
-                    comment_created_at=comment_ts,
-                ))
-        try:
-            db.session.commit()
-        except Exception:
-            db.session.rollback()
-            continue
-        # Mark bot-posted comments as addressed so we never respond to our own replies.
+            rows[int(cid)] = {
+                "project_id": project_id,
+                "ticket_id": ticket_id,
+                "pr_number": pr_number,
+                "github_comment_id": int(cid),
+                "author_login": c.get("login"),
+                "body": body,
+                "comment_created_at": comment_ts,
+            }
+        if rows:
+            stmt = pg_insert(PRReviewComment.__table__).values(list(rows.values()))
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(stmt.on_conflict_do_update(
+                        index_elements=["project_id", "pr_number", "github_comment_id"],
+                        set_={
+                            "body": stmt.excluded.body,
+                            "author_login": stmt.excluded.author_login,
+                            "comment_created_at": stmt.excluded.comment_created_at,
+                            "updated_at": func.now(),
+                        },
+                    ))
+            except Exception:
+                current_app.logger.exception("PR #%s: failed to store review comments", pr_number)
+                continue
+        # Advance the watermark only when every endpoint was read, so a failed fetch is retried in full.
+        if fetched_all:
+            newest = max((c["created_at"] for c in raw_comments if c.get("created_at")), default=since)
+            if newest:
+                watermarks[since_key] = newest
+        pending_prs[(project_id, pr_number)] = ticket_id
+
+    if pending_prs:
+        # Mark bot-posted comments as addressed so we never respond to our own replies, in one UPDATE for all PRs.
         # We identify bot comments by the BOT_COMMENT_SIGNATURE embedded in the body,
         # which is more reliable than login-based filtering when agent and user share a token.
-        our_comments = PRReviewComment.query.filter(
-            PRReviewComment.project_id == project.id,
-            PRReviewComment.pr_number == pr_number,
+        now = datetime.utcnow()
+        PRReviewComment.query.filter(
+            tuple_(PRReviewComment.project_id, PRReviewComment.pr_number).in_(list(pending_prs)),
             PRReviewComment.body.contains(BOT_COMMENT_SIGNATURE),
             PRReviewComment.addressed_at.is_(None),
-        ).all()
-        for row in our_comments:
-            row.addressed_at = _dt.utcnow()
-            row.updated_at = _dt.utcnow()
-        if our_comments:
-            try:
-                db.session.commit()
-            except Exception:
-                db.session.rollback()
-        # Trigger only for the single most recent unaddressed human comment (no bot signature)
-        next_comment = (
-            PRReviewComment.query.filter(
-                PRReviewComment.project_id == project.id,
-                PRReviewComment.pr_number == pr_number,
-                PRReviewComment.addressed_at.is_(None),
-                PRReviewComment.body.isnot(None),
-                PRReviewComment.body != "",
-                ~PRReviewComment.body.contains(BOT_COMMENT_SIGNATURE),
-            )
-            .order_by(nullslast(PRReviewComment.comment_created_at.desc()))
-            .limit(1)
-            .first()
+        ).update({"addressed_at": now, "updated_at": now}, synchronize_session=False)
+    # One commit for the whole tick; each PR's writes ran in a savepoint so one bad PR does not abort the rest.
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception("PR review poll: commit failed")
+        return
+    _pr_comment_since.update(watermarks)
+    if only is None:
+        for key in [k for k in _pr_comment_since if k not in pending_prs]:
+            del _pr_comment_since[key]
+    for pr_number, state, ticket_id in done:
+        current_app.logger.info("PR #%s %s; moved ticket %s to done", pr_number, state, ticket_id)
+    if not pending_prs:
+        return
+    # Trigger only for the single most recent unaddressed human comment (no bot signature) per PR,
+    # picked in one window-function query instead of one query per PR.
+    rank = func.row_number().over(
+        partition_by=(PRReviewComment.project_id, PRReviewComment.pr_number),
+        order_by=nullslast(PRReviewComment.comment_created_at.desc()),
+    ).label("rank")
+    ranked = (
+        db.session.query(
+            PRReviewComment.project_id,
+            PRReviewComment.pr_number,
+            PRReviewComment.github_comment_id,
+            PRReviewComment.body,
+            rank,
         )
-        if next_comment:
-            _enqueue_review_job(
-                ticket.id,
-                next_comment.body,
-                pr_number,
-                project.id,
-                next_comment.github_comment_id,
-            )
+        .filter(
+            tuple_(PRReviewComment.project_id, PRReviewComment.pr_number).in_(list(pending_prs)),
+            PRReviewComment.addressed_at.is_(None),
+            PRReviewComment.body.isnot(None),
+            PRReviewComment.body != "",
+            ~PRReviewComment.body.contains(BOT_COMMENT_SIGNATURE),
+        )
+        .subquery()
+    )
+    for row in db.session.query(ranked).filter(ranked.c.rank == 1).all():
+        _enqueue_review_job(
+            pending_prs[(row.project_id, row.pr_number)],
+            row.body,
+            row.pr_number,
+            row.project_id,
+            row.github_comment_id,
+        )
+
 
 
+
+@api_bp.route("/webhooks/github", methods=["POST"])
+def github_webhook():
+    """GitHub repo webhook: verify X-Hub-Signature-256 against GITHUB_WEBHOOK_SECRET and refresh the PR the
+    event is about (new review comments are enqueued exactly as the background poll would)."""
+    secret = (get_setting_or_env("GITHUB_WEBHOOK_SECRET") or "").strip()
+    if not secret:
+        return jsonify({"error": "GitHub webhook secret not configured"}), 404
+    expected = "sha256=" + hmac.new(secret.encode(), request.get_data(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, request.headers.get("X-Hub-Signature-256") or ""):
+        return jsonify({"error": "Invalid signature"}), 401
+    event = request.headers.get("X-GitHub-Event") or ""
+    if event == "ping":
+        return jsonify({"message": "pong"})
+    if event not in _GH_WEBHOOK_PR_EVENTS:
+        return jsonify({"message": "ignored"}), 202
+    payload = request.get_json(silent=True) or {}
+    slug = (payload.get("repository") or {}).get("full_name")
+    if event == "issue_comment":
+        issue = payload.get("issue") or {}
+        pr_number = issue.get("number") if "pull_request" in issue else None
+    else:
+        pr_number = (payload.get("pull_request") or {}).get("number")
+    if not slug or not pr_number:
+        return jsonify({"message": "ignored"}), 202
+    _poll_single_pr_async(current_app._get_current_object(), slug, int(pr_number))
+    return jsonify({"message": "accepted"}), 202
@@ -47,6 +47,8 @@ def create_app():
         AGENT_LLM_URL="",
         MEMORY_SAVE_DIR=memory_save_dir,
     )
+    # jsonify keeps insertion order instead of sorting every dict's keys (nothing depends on sorted output)
+    app.json.sort_keys = False
 
     db.init_app(app)
     with app.app_context():
@@ -64,6 +66,10 @@ def create_app():
     runner = threading.Thread(target=_run_pr_poll_loop, args=(app,), kwargs={"pr_poll_seconds": 600}, daemon=True)
     runner.start()
 
+    # Import HippoRAG in the background so the first memory request doesn't pay for it under the memory lock.
+    from utils.memory import preload as preload_memory
+    threading.Thread(target=preload_memory, daemon=True).start()
+
     # Health check endpoint
     @app.route("/health")
     def health():
@@ -67,6 +67,7 @@ class Ticket(db.Model):
     status = db.Column(db.String(50), default="todo")
     created_at = db.Column(db.TIMESTAMP, default=db.func.now())
     updated_at = db.Column(db.TIMESTAMP, default=db.func.now(), onupdate=db.func.now())
+    cancel_requested_at = db.Column(db.TIMESTAMP)  # set by UI cancel; cleared when a new job is enqueued
 
     comments = db.relationship("TicketComment", backref="ticket", cascade="all, delete-orphan")
     execution_logs = db.relationship("ExecutionLog", backref="ticket", cascade="all, delete-orphan")
@@ -88,8 +89,8 @@ class Note(db.Model):
 
     id = db.Column(db.UUID, primary_key=True, default=db.func.uuid_generate_v4())
     project_id = db.Column(db.UUID, db.ForeignKey("projects.id"), nullable=False)
-    node_id = db.Column(db.Text)
-    edge_id = db.Column(db.Text)
+    node_id = db.Column(ARRAY(db.Text))  # linked graph node ids (GIN-indexed)
+    edge_id = db.Column(ARRAY(db.Text))  # linked graph edge ids (GIN-indexed)
     title = db.Column(db.String(255))
     content = db.Column(db.Text)
     created_at = db.Column(db.TIMESTAMP, default=db.func.now())
@@ -185,6 +186,25 @@ class AgentJob(db.Model):
     comment_body = db.Column(db.Text)
     github_comment_id = db.Column(db.BigInteger)
 
+    # One active job per ticket and kind; enqueue relies on this across backend processes.
+    __table_args__ = (
+        db.Index(
+            "_agent_job_active_uniq",
+            "ticket_id",
+            "kind",
+            unique=True,
+            postgresql_where=db.text("status IN ('pending', 'running')"),
+        ),
+        # Claim path (worker_jobs_start): oldest pending job, optionally within one project
+        db.Index("idx_agent_jobs_pending", "created_at", postgresql_where=db.text("status = 'pending'")),
+        db.Index(
+            "idx_agent_jobs_project_pending",
+            "project_id",
+            "created_at",
+            postgresql_where=db.text("status = 'pending'"),
+        ),
+    )
+
 
 class RAGEmbedding(db.Model):
     __tablename__ = "rag_embeddings"
@@ -194,5 +214,7 @@ class RAGEmbedding(db.Model):
     source_type = db.Column(db.String(50), nullable=False)  # "node", "edge", "note", "ticket", "ticket_comment"
     source_id = db.Column(db.UUID, nullable=False)
     content = db.Column(db.Text, nullable=False)
-    embedding = db.Column(ARRAY(Float), nullable=False)  # 768 dimensions (embedding service)
+    embedding = db.Column(ARRAY(Float), nullable=False)  # halfvec(768) in the DB (migration 015); never SELECTed via the ORM
     created_at = db.Column(db.TIMESTAMP, default=db.func.now())
+
+    __table_args__ = (db.UniqueConstraint("project_id", "source_type", "source_id", name="_rag_embedding_source_uniq"),)
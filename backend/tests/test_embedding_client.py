@@ -95,6 +95,36 @@ class TestEmbedClient(unittest.TestCase):
                     call_kwargs = mock_client.embeddings.create.call_args.kwargs
                     self.assertEqual(call_kwargs["model"], "text-embedding-3-small")
 
+    def test_embed_query_memoizes_per_model(self):
+        """Repeated queries for the same model hit the service once; a model change re-embeds."""
+        import utils.embedding_client as ec
+        ec._embed_query_cached.cache_clear()
+        mock_client = MagicMock()
+        mock_client.embeddings.create.return_value = _mock_openai_response([[0.1, 0.2]])
+        with patch.object(ec, "_get_client", return_value=mock_client):
+            with patch.object(ec, "_default_model", return_value="model-a"):
+                self.assertEqual(ec.embed_query("q"), [0.1, 0.2])
+                self.assertEqual(ec.embed_query("q"), [0.1, 0.2])
+            with patch.object(ec, "_default_model", return_value="model-b"):
+                ec.embed_query("q")
+        self.assertEqual(mock_client.embeddings.create.call_count, 2)
+        self.assertEqual(mock_client.embeddings.create.call_args.kwargs["timeout"], ec.QUERY_EMBED_TIMEOUT_SEC)
+        ec._embed_query_cached.cache_clear()
+
+    def test_clear_query_cache_re_embeds(self):
+        """After a settings change clears the cache, the same query goes to the (possibly new) service again."""
+        import utils.embedding_client as ec
+        ec.clear_query_cache()
+        mock_client = MagicMock()
+        mock_client.embeddings.create.return_value = _mock_openai_response([[0.1]])
+        with patch.object(ec, "_get_client", return_value=mock_client), \
+                patch.object(ec, "_default_model", return_value="model-a"):
+            ec.embed_query("q")
+            ec.clear_query_cache()
+            ec.embed_query("q")
+        self.assertEqual(mock_client.embeddings.create.call_count, 2)
+        ec.clear_query_cache()
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,126 @@
+"""
+Unit tests for _gh_get / _gh_send in api.routes — the GitHub REST helpers used by the PR poller and the
+review actions (conditional GETs, pagination, rate-limit backoff, error details).
+Patches the shared requests session — no network required.
+"""
+import json
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _BACKEND_DIR not in sys.path:
+    sys.path.insert(0, _BACKEND_DIR)
+
+import api.routes as routes
+
+
+def _response(status=200, payload=None, headers=None, next_url=None):
+    r = MagicMock()
+    r.status_code = status
+    r.headers = headers or {}
+    r.content = json.dumps(payload).encode()
+    r.links = {"next": {"url": next_url}} if next_url else {}
+    return r
+
+
+class TestGhConditionalGet(unittest.TestCase):
+    def setUp(self):
+        routes._gh_etag_cache.clear()
+        routes._gh_rate_limit_until = 0.0
+
+    def tearDown(self):
+        routes._gh_etag_cache.clear()
+        routes._gh_rate_limit_until = 0.0
+
+    def test_304_returns_cached_payload_and_sends_validators(self):
+        first = _response(payload=[{"id": 1}], headers={"ETag": '"abc"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"})
+        with patch.object(routes._gh_http, "get", side_effect=[first, _response(status=304)]) as get:
+            self.assertEqual(routes._gh_get("repos/o/r/pulls/1/reviews", "tok", {"per_page": 100}), [{"id": 1}])
+            self.assertEqual(routes._gh_get("repos/o/r/pulls/1/reviews", "tok", {"per_page": 100}), [{"id": 1}])
+        headers = get.call_args_list[1].kwargs["headers"]
+        self.assertEqual(headers["If-None-Match"], '"abc"')
+        self.assertEqual(headers["If-Modified-Since"], "Mon, 01 Jan 2024 00:00:00 GMT")
+
+    def test_changed_params_skip_validators(self):
+        """A new since= is a different query, so the old ETag must not be sent for it."""
+        first = _response(payload=[], headers={"ETag": '"abc"'})
+        with patch.object(routes._gh_http, "get", side_effect=[first, _response(payload=[{"id": 2}])]) as get:
+            routes._gh_get("repos/o/r/issues/1/comments", "tok", {"since": "a"})
+            self.assertEqual(routes._gh_get("repos/o/r/issues/1/comments", "tok", {"since": "b"}), [{"id": 2}])
+        self.assertNotIn("If-None-Match", get.call_args_list[1].kwargs["headers"])
+
+    def test_follows_next_links(self):
+        pages = [_response(payload=[{"id": 1}], next_url="https://api.github.com/x?page=2"), _response(payload=[{"id": 2}])]
+        with patch.object(routes._gh_http, "get", side_effect=pages):
+            self.assertEqual(routes._gh_get("repos/o/r/pulls/1/comments", "tok"), [{"id": 1}, {"id": 2}])
+
+    def test_newest_page_only_reads_last_page_and_skips_cache(self):
+        first = _response(payload=[{"id": 1}], headers={"ETag": '"abc"'}, next_url="https://api.github.com/x?page=2")
+        first.links["last"] = {"url": "https://api.github.com/x?page=9"}
+        with patch.object(routes._gh_http, "get", side_effect=[first, _response(payload=[{"id": 900}])]) as get:
+            self.assertEqual(routes._gh_get("repos/o/r/pulls/1/reviews", "tok", all_pages=False), [{"id": 900}])
+        self.assertEqual(get.call_args_list[1].args[0], "https://api.github.com/x?page=9")
+        self.assertNotIn("repos/o/r/pulls/1/reviews", routes._gh_etag_cache)
+
+    def test_cache_evicts_oldest_path_beyond_cap(self):
+        with patch.object(routes, "_GH_ETAG_CACHE_MAX", 2), \
+                patch.object(routes._gh_http, "get", side_effect=lambda *a, **k: _response(payload=[], headers={"ETag": '"e"'})):
+            for n in range(3):
+                routes._gh_get(f"repos/o/r/pulls/{n}/comments", "tok")
+        self.assertEqual(list(routes._gh_etag_cache), ["repos/o/r/pulls/1/comments", "repos/o/r/pulls/2/comments"])
+
+    def test_low_remaining_quota_sets_backoff_until_reset(self):
+        r = _response(payload={}, headers={"X-RateLimit-Remaining": "3", "X-RateLimit-Reset": "4102444800"})
+        with patch.object(routes._gh_http, "get", return_value=r):
+            routes._gh_get("repos/o/r/pulls/1", "tok")
+        self.assertEqual(routes._gh_rate_limit_until, 4102444800.0)
+
+    def test_healthy_quota_leaves_backoff_unset(self):
+        r = _response(payload={}, headers={"X-RateLimit-Remaining": "4000", "X-RateLimit-Reset": "4102444800"})
+        with patch.object(routes._gh_http, "get", return_value=r):
+            routes._gh_get("repos/o/r/pulls/1", "tok")
+        self.assertEqual(routes._gh_rate_limit_until, 0.0)
+
+
+class TestGhSend(unittest.TestCase):
+    def test_success(self):
+        r = _response(status=201, payload={"id": 1})
+        r.ok = True
+        with patch.object(routes._gh_http, "request", return_value=r) as req:
+            self.assertEqual(routes._gh_send("POST", "repos/o/r/issues/1/comments", "tok", {"body": "hi"}), (True, ""))
+        self.assertEqual(req.call_args.args, ("POST", "https://api.github.com/repos/o/r/issues/1/comments"))
+        self.assertEqual(req.call_args.kwargs["json"], {"body": "hi"})
+
+    def test_failure_returns_github_message(self):
+        r = _response(status=405, payload={"message": "Pull Request is not mergeable"})
+        r.ok = False
+        r.json.return_value = {"message": "Pull Request is not mergeable"}
+        with patch.object(routes._gh_http, "request", return_value=r):
+            self.assertEqual(
+                routes._gh_send("PUT", "repos/o/r/pulls/1/merge", "tok", {"merge_method": "squash"}),
+                (False, "Pull Request is not mergeable"),
+            )
+
+
+class TestFetchPrStatesGraphql(unittest.TestCase):
+    def test_one_request_per_batch_and_rest_spelling(self):
+        data = {"r": {"p1": {"state": "OPEN", "merged": False}, "p2": {"state": "MERGED", "merged": True}, "p3": None}}
+        with patch.object(routes, "_PR_STATE_BATCH", 2), \
+                patch.object(routes, "_gh_graphql", side_effect=[data, data]) as gql:
+            states = routes._fetch_pr_states_graphql("o/r", [1, 2, 3], "tok", MagicMock())
+        self.assertEqual(gql.call_count, 2)
+        self.assertEqual(states, {1: ("open", False), 2: ("closed", True)})
+
+
+class TestMarkMerged(unittest.TestCase):
+    def test_evicts_oldest_beyond_cap(self):
+        with patch.object(routes, "_MERGED_PRS_MAX", 2), patch.object(routes, "_merged_prs", {}):
+            routes._mark_merged([("o/r", 1), ("o/r", 2)])
+            routes._mark_merged([("o/r", 3)])
+            self.assertEqual(list(routes._merged_prs), [("o/r", 2), ("o/r", 3)])
+
+
+if __name__ == "__main__":
+    unittest.main()
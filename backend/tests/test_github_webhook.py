@@ -0,0 +1,91 @@
+"""
+Unit tests for POST /api/webhooks/github (signature check and PR dispatch) and the queued PR refresh.
+Patches the webhook secret and the PR refresh — no database or network required.
+"""
+import hashlib
+import hmac
+import json
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+from flask import Flask
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _BACKEND_DIR not in sys.path:
+    sys.path.insert(0, _BACKEND_DIR)
+
+import api.routes as routes
+from api import api_bp
+
+_SECRET = "s3cret"
+
+
+def _signed(payload, secret=_SECRET):
+    body = json.dumps(payload).encode()
+    return body, "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+class TestGithubWebhook(unittest.TestCase):
+    def setUp(self):
+        app = Flask(__name__)
+        app.register_blueprint(api_bp, url_prefix="/api")
+        self.client = app.test_client()
+
+    def _post(self, event, payload, secret=_SECRET):
+        body, sig = _signed(payload, secret)
+        return self.client.post(
+            "/api/webhooks/github",
+            data=body,
+            content_type="application/json",
+            headers={"X-GitHub-Event": event, "X-Hub-Signature-256": sig},
+        )
+
+    def test_pr_comment_refreshes_that_pr(self):
+        payload = {"repository": {"full_name": "o/r"}, "issue": {"number": 7, "pull_request": {}}}
+        with patch.object(routes, "get_setting_or_env", return_value=_SECRET), \
+                patch.object(routes, "_poll_single_pr_async") as refresh:
+            r = self._post("issue_comment", payload)
+        self.assertEqual(r.status_code, 202)
+        self.assertEqual(refresh.call_args.args[1:], ("o/r", 7))
+
+    def test_bad_signature_rejected(self):
+        payload = {"repository": {"full_name": "o/r"}, "pull_request": {"number": 7}}
+        with patch.object(routes, "get_setting_or_env", return_value=_SECRET), \
+                patch.object(routes, "_poll_single_pr_async") as refresh:
+            r = self._post("pull_request_review", payload, secret="wrong")
+        self.assertEqual(r.status_code, 401)
+        refresh.assert_not_called()
+
+    def test_plain_issue_comment_ignored(self):
+        payload = {"repository": {"full_name": "o/r"}, "issue": {"number": 3}}
+        with patch.object(routes, "get_setting_or_env", return_value=_SECRET), \
+                patch.object(routes, "_poll_single_pr_async") as refresh:
+            r = self._post("issue_comment", payload)
+        self.assertEqual(r.status_code, 202)
+        refresh.assert_not_called()
+
+    def test_disabled_without_secret(self):
+        with patch.object(routes, "get_setting_or_env", return_value=None):
+            r = self._post("ping", {})
+        self.assertEqual(r.status_code, 404)
+
+
+class TestPollSinglePrAsync(unittest.TestCase):
+    def test_queued_refresh_is_not_duplicated(self):
+        app = Flask(__name__)
+        with patch.object(routes, "_pr_refresh_pool") as pool:
+            routes._poll_single_pr_async(app, "o/r", 7)
+            routes._poll_single_pr_async(app, "o/r", 7)
+            self.assertEqual(pool.submit.call_count, 1)
+            with patch.object(routes, "_poll_pr_review_comments") as poll:
+                pool.submit.call_args.args[0]()
+            poll.assert_called_once_with(only=("o/r", 7))
+            routes._poll_single_pr_async(app, "o/r", 7)
+            self.assertEqual(pool.submit.call_count, 2)
+        routes._pr_refresh_pending.clear()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+"""
+Unit tests for the background note-embedding queue in api.routes (coalescing, ordering, delete handling) and the
+note-gated write in utils.rag. Patches the pool, the DB session and the embedding call — no database or embedding
+service required.
+"""
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+from uuid import uuid4
+
+from flask import Flask
+from sqlalchemy.dialects import postgresql
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _BACKEND_DIR not in sys.path:
+    sys.path.insert(0, _BACKEND_DIR)
+
+import api.routes as routes
+import utils.rag as rag
+
+
+class TestNoteEmbeddingQueue(unittest.TestCase):
+    def setUp(self):
+        routes._note_embed_pending.clear()
+        routes._note_embed_inflight.clear()
+        self.app = Flask(__name__)
+
+    def tearDown(self):
+        routes._note_embed_pending.clear()
+        routes._note_embed_inflight.clear()
+
+    def test_edits_while_queued_embed_latest_content_once(self):
+        pid, nid = uuid4(), uuid4()
+        with self.app.app_context(), patch.object(routes, "_note_embed_pool") as pool:
+            routes._upsert_note_embedding_async(pid, nid, "first")
+            routes._upsert_note_embedding_async(pid, nid, "second")
+            self.assertEqual(pool.submit.call_count, 1)
+            with patch.object(routes, "upsert_note_embedding") as upsert:
+                pool.submit.call_args.args[0]()
+        upsert.assert_called_once_with(pid, nid, "second")
+        self.assertNotIn((pid, nid), routes._note_embed_inflight)
+
+    def test_edit_during_write_runs_after_it_with_newer_content(self):
+        """An edit landing mid-write must not start a concurrent refresh; the refresh requeues once it finishes."""
+        pid, nid = uuid4(), uuid4()
+        written = []
+        with self.app.app_context(), patch.object(routes, "_note_embed_pool") as pool:
+            routes._upsert_note_embedding_async(pid, nid, "old")
+
+            def write(project_id, note_id, content):
+                if content == "old":
+                    routes._upsert_note_embedding_async(pid, nid, "new")
+                    self.assertEqual(pool.submit.call_count, 1)  # no second worker while this write runs
+                written.append(content)
+
+            with patch.object(routes, "upsert_note_embedding", side_effect=write):
+                pool.submit.call_args.args[0]()
+                self.assertEqual(pool.submit.call_count, 2)
+                pool.submit.call_args.args[0]()
+        self.assertEqual(written, ["old", "new"])
+        self.assertEqual(pool.submit.call_count, 2)
+        self.assertNotIn((pid, nid), routes._note_embed_inflight)
+
+    def test_deleted_before_run_skips_embedding(self):
+        pid, nid = uuid4(), uuid4()
+        with self.app.app_context(), patch.object(routes, "_note_embed_pool") as pool:
+            routes._upsert_note_embedding_async(pid, nid, "text")
+            routes._note_embed_pending.pop((pid, nid))  # what note DELETE does
+            with patch.object(routes, "upsert_note_embedding") as upsert:
+                pool.submit.call_args.args[0]()
+        upsert.assert_not_called()
+        self.assertNotIn((pid, nid), routes._note_embed_inflight)
+
+
+class TestUpsertNoteEmbedding(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+
+    def _session(self, stored, note_row):
+        session = MagicMock()
+        stored_q = MagicMock()
+        stored_q.filter_by.return_value.scalar.return_value = stored
+        note_q = MagicMock()
+        note_q.filter_by.return_value.with_for_update.return_value.first.return_value = note_row
+        session.query.side_effect = [stored_q, note_q]
+        return session, note_q
+
+    def test_note_deleted_before_lock_writes_nothing(self):
+        """DELETE commits between the embedding call and the write: the share lock finds no note, nothing lands."""
+        pid, nid = uuid4(), uuid4()
+        session, _ = self._session(stored=None, note_row=None)
+        with self.app.app_context(), patch.object(rag.db, "session", session), \
+                patch.object(rag, "embed_single", return_value=[0.1, 0.2]):
+            rag.upsert_note_embedding(pid, nid, "text")
+        session.execute.assert_not_called()
+        session.commit.assert_not_called()
+        session.rollback.assert_called_once()
+
+    def test_write_happens_under_note_share_lock(self):
+        pid, nid = uuid4(), uuid4()
+        session, note_q = self._session(stored="old", note_row=(nid,))
+        with self.app.app_context(), patch.object(rag.db, "session", session), \
+                patch.object(rag, "embed_single", return_value=[0.1, 0.2]):
+            rag.upsert_note_embedding(pid, nid, "new")
+        note_q.filter_by.return_value.with_for_update.assert_called_once_with(read=True)
+        session.execute.assert_called_once()
+        sql = str(session.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+        self.assertIn("ON CONFLICT (project_id, source_type, source_id) DO UPDATE", sql)
+        session.commit.assert_called_once()
+
+    def test_unchanged_content_skips_embedding(self):
+        pid, nid = uuid4(), uuid4()
+        session, _ = self._session(stored="same", note_row=(nid,))
+        with self.app.app_context(), patch.object(rag.db, "session", session), \
+                patch.object(rag, "embed_single") as embed_single:
+            rag.upsert_note_embedding(pid, nid, "same")
+        embed_single.assert_not_called()
+        session.execute.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
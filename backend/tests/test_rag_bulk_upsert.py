@@ -0,0 +1,114 @@
+"""
+Unit tests for utils.rag writes (upsert_embedding short-circuit, upsert_embeddings_bulk, bulk deletes).
+Mocks the embedding call and the DB session — no network or Postgres required.
+"""
+import csv
+import io
+import os
+import sys
+import unittest
+from unittest.mock import patch
+from uuid import uuid4
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _BACKEND_DIR not in sys.path:
+    sys.path.insert(0, _BACKEND_DIR)
+
+
+class TestUpsertEmbeddingsBulk(unittest.TestCase):
+    def test_blank_items_skip_embedding_and_db(self):
+        from utils import rag
+        with patch.object(rag, "embed") as mock_embed, patch.object(rag, "db") as mock_db:
+            rag.upsert_embeddings_bulk(uuid4(), [("node", uuid4(), "  "), ("edge", uuid4(), None)])
+        mock_embed.assert_not_called()
+        mock_db.session.execute.assert_not_called()
+
+    def test_batches_embed_calls_and_executes_one_statement(self):
+        from utils import rag
+        items = [("node", uuid4(), f"node {i}") for i in range(5)]
+        with patch.object(rag, "EMBED_BATCH_SIZE", 2), \
+                patch.object(rag, "embed", side_effect=lambda texts: [[0.0]] * len(texts)) as mock_embed, \
+                patch.object(rag, "db") as mock_db:
+            rag.upsert_embeddings_bulk(uuid4(), items)
+        self.assertEqual([len(c.args[0]) for c in mock_embed.call_args_list], [2, 2, 1])
+        mock_db.session.execute.assert_called_once()
+        mock_db.session.commit.assert_called_once()
+
+    def test_duplicate_sources_are_embedded_once(self):
+        from utils import rag
+        sid = uuid4()
+        with patch.object(rag, "embed", side_effect=lambda texts: [[0.0]] * len(texts)) as mock_embed, \
+                patch.object(rag, "db"):
+            rag.upsert_embeddings_bulk(uuid4(), [("node", sid, "old"), ("node", sid, "new")])
+        mock_embed.assert_called_once_with(["new"])
+
+    def test_unchanged_sources_are_not_reembedded(self):
+        from utils import rag
+        same, edited = uuid4(), uuid4()
+        with patch.object(rag, "embed", side_effect=lambda texts: [[0.0]] * len(texts)) as mock_embed, \
+                patch.object(rag, "db") as mock_db:
+            mock_db.session.query.return_value.filter.return_value.all.return_value = [
+                ("node", same, "service api"), ("node", edited, "service old"),
+            ]
+            rag.upsert_embeddings_bulk(uuid4(), [("node", same, "service api"), ("node", edited, "service new")])
+        mock_embed.assert_called_once_with(["service new"])
+
+    def test_nothing_changed_skips_embedding_and_write(self):
+        from utils import rag
+        sid = uuid4()
+        with patch.object(rag, "embed") as mock_embed, patch.object(rag, "db") as mock_db:
+            mock_db.session.query.return_value.filter.return_value.all.return_value = [("edge", sid, "a -> b")]
+            rag.upsert_embeddings_bulk(uuid4(), [("edge", sid, "a -> b")])
+        mock_embed.assert_not_called()
+        mock_db.session.execute.assert_not_called()
+        mock_db.session.commit.assert_not_called()
+
+    def test_large_batches_load_through_copy(self):
+        from utils import rag
+        items = [("edge", uuid4(), f'edge "{i}", labelled') for i in range(3)]
+        with patch.object(rag, "COPY_MIN_ROWS", 3), \
+                patch.object(rag, "embed", side_effect=lambda texts: [[0.5, 1.0]] * len(texts)), \
+                patch.object(rag, "db") as mock_db:
+            rag.upsert_embeddings_bulk(uuid4(), items)
+        cur = mock_db.session.connection.return_value.connection.cursor.return_value.__enter__.return_value
+        sql, buf = cur.copy_expert.call_args.args
+        self.assertIn("COPY rag_stage", sql)
+        rows = list(csv.reader(io.StringIO(buf.getvalue())))
+        self.assertEqual([r[3] for r in rows], [c for _, _, c in items])
+        self.assertEqual(rows[0][4], "[0.5,1.0]")
+        mock_db.session.execute.assert_not_called()
+        mock_db.session.commit.assert_called_once()
+
+
+class TestUpsertEmbeddingUnchanged(unittest.TestCase):
+    def test_unchanged_content_skips_embedding(self):
+        from utils import rag
+        with patch.object(rag, "embed_single") as mock_embed, patch.object(rag, "db") as mock_db, \
+                patch.object(rag, "RAGEmbedding") as mock_model:
+            mock_db.session.query.return_value.filter_by.return_value.scalar.return_value = "same text"
+            rag.upsert_embedding(uuid4(), "ticket", uuid4(), "  same text ")
+        mock_embed.assert_not_called()
+        mock_model.query.filter_by.assert_not_called()
+        mock_db.session.commit.assert_not_called()
+
+
+class TestDeleteEmbeddingsForSources(unittest.TestCase):
+    def test_one_delete_and_commit_for_all_sources(self):
+        from utils import rag
+        sid = uuid4()
+        with patch.object(rag, "RAGEmbedding") as mock_model, patch.object(rag, "tuple_") as mock_tuple, \
+                patch.object(rag, "db") as mock_db:
+            rag.delete_embeddings_for_sources(uuid4(), [("ticket", sid), ("ticket_comment", uuid4()), ("ticket", sid)])
+        self.assertEqual(len(mock_tuple.return_value.in_.call_args.args[0]), 2)
+        mock_model.query.filter.return_value.delete.assert_called_once_with(synchronize_session=False)
+        mock_db.session.commit.assert_called_once()
+
+    def test_no_sources_skips_db(self):
+        from utils import rag
+        with patch.object(rag, "db") as mock_db:
+            rag.delete_embeddings_for_sources(uuid4(), [])
+        mock_db.session.commit.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+"""
+Unit tests for the bulk settings helpers: get_settings_or_env (worker-context, get_agent_env) and set_values
+(settings PUT). The database session is patched — no database required.
+"""
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+from flask import Flask
+from sqlalchemy.dialects import postgresql
+
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _BACKEND_DIR not in sys.path:
+    sys.path.insert(0, _BACKEND_DIR)
+
+from utils.app_settings import get_settings_or_env, set_values
+
+
+class TestGetSettingsOrEnv(unittest.TestCase):
+    def test_falls_back_to_env_without_app_context(self):
+        with patch.dict(os.environ, {"AGENT_MODEL": "m1", "NOT_A_SETTING": "x"}, clear=False):
+            os.environ.pop("WORKER_MODEL", None)
+            out = get_settings_or_env(("AGENT_MODEL", "WORKER_MODEL", "NOT_A_SETTING"))
+        self.assertEqual(out, {"AGENT_MODEL": "m1", "WORKER_MODEL": None, "NOT_A_SETTING": "x"})
+
+
+class TestSetValues(unittest.TestCase):
+    def test_rejects_whole_batch_before_writing(self):
+        """An unknown key or an unencryptable secret fails the batch before any DB access."""
+        with Flask(__name__).app_context(), patch("models.db.db") as mock_db:
+            self.assertFalse(set_values({"AGENT_MODEL": "m", "NOT_A_SETTING": "x"}))
+            with patch("utils.app_settings.is_encryption_available", return_value=False):
+                self.assertFalse(set_values({"AGENT_MODEL": "m", "AGENT_API_KEY": "secret"}))
+        mock_db.session.execute.assert_not_called()
+        mock_db.session.commit.assert_not_called()
+
+    def test_upsert_bumps_updated_at(self):
+        """ON CONFLICT DO UPDATE skips the column onupdate, so updated_at must be in the SET clause."""
+        with Flask(__name__).app_context(), patch("models.db.db") as mock_db:
+            self.assertTrue(set_values({"AGENT_MODEL": "m"}))
+        sql = str(mock_db.session.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+        self.assertIn("updated_at = now()", sql)
+        mock_db.session.commit.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -13,6 +13,7 @@ from utils.app_settings_crypto import encrypt_value, decrypt_value, is_encryptio
 ALLOWED_KEYS = frozenset({
     # GitHub (sensitive)
     "github_agent_token",
+    "GITHUB_WEBHOOK_SECRET",
     # LLM / API keys (sensitive)
     "openai_api_key",
     "anthropic_api_key",
@@ -54,6 +55,7 @@ ALLOWED_KEYS = frozenset({
 # Keys stored encrypted; rest stored plain (URLs, paths, model names, etc.)
 SENSITIVE_KEYS = frozenset({
     "github_agent_token",
+    "GITHUB_WEBHOOK_SECRET",
     "openai_api_key",
     "anthropic_api_key",
     "AGENT_API_KEY",
@@ -83,19 +85,18 @@ def get_value(key: str) -> Optional[str]:
 
 def set_value(key: str, plaintext: str) -> bool:
     """Store value. Sensitive keys are encrypted (requires TERARCHITECT_SECRET_KEY). Plain keys stored as-is. Returns False if key not allowed or encryption required but unavailable."""
-    import sys
+    from flask import current_app
     if key not in ALLOWED_KEYS:
-        print(f"[DEBUG] set_value: key {key!r} not in ALLOWED_KEYS", file=sys.stderr, flush=True)
+        current_app.logger.debug("set_value: key %r not in ALLOWED_KEYS", key)
         return False
-    from flask import current_app
     from models.db import db, AppSetting
     if key in SENSITIVE_KEYS:
         if not is_encryption_available():
-            print("[DEBUG] set_value: encryption not available", file=sys.stderr, flush=True)
+            current_app.logger.debug("set_value: encryption not available")
             return False
         encrypted = encrypt_value(plaintext)
         if not encrypted:
-            print("[DEBUG] set_value: encrypt_value returned None", file=sys.stderr, flush=True)
+            current_app.logger.debug("set_value: encrypt_value returned None")
             return False
         value_to_store = encrypted
     else:
@@ -109,11 +110,8 @@ def set_value(key: str, plaintext: str) -> bool:
                 db.session.add(AppSetting(key=key, value=value_to_store))
             db.session.commit()
             return True
-    except Exception as e:
-        import sys
-        print(f"[DEBUG] set_value exception: {type(e).__name__}: {e}", file=sys.stderr, flush=True)
-        import traceback
-        traceback.print_exc(file=sys.stderr)
+    except Exception:
+        current_app.logger.exception("set_value(%r) failed", key)
         try:
             db.session.rollback()
         except Exception:
@@ -121,6 +119,47 @@ def set_value(key: str, plaintext: str) -> bool:
         return False
 
 
+def set_values(updates: dict) -> bool:
+    """Store many settings in one transaction: {key: plaintext} upserts, {key: None} clears. One DELETE for the
+    cleared keys and one INSERT ... ON CONFLICT for the rest, then a single commit. Returns False (nothing written)
+    if any key is not allowed or a sensitive value cannot be encrypted."""
+    from flask import current_app
+    from sqlalchemy import func
+    from sqlalchemy.dialects.postgresql import insert as pg_insert
+    from models.db import db, AppSetting
+    cleared = []
+    rows = []
+    for key, plaintext in updates.items():
+        if key not in ALLOWED_KEYS:
+            current_app.logger.debug("set_values: key %r not in ALLOWED_KEYS", key)
+            return False
+        if plaintext is None:
+            cleared.append(key)
+            continue
+        value_to_store = plaintext
+        if key in SENSITIVE_KEYS:
+            value_to_store = encrypt_value(plaintext) if is_encryption_available() else None
+            if not value_to_store:
+                current_app.logger.debug("set_values: could not encrypt %r", key)
+                return False
+        rows.append({"key": key, "value": value_to_store})
+    try:
+        if cleared:
+            AppSetting.query.filter(AppSetting.key.in_(cleared)).delete(synchronize_session=False)
+        if rows:
+            stmt = pg_insert(AppSetting).values(rows)
+            # ON CONFLICT bypasses the column's onupdate, so updated_at is set explicitly
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=["key"], set_={"value": stmt.excluded.value, "updated_at": func.now()}
+            ))
+        db.session.commit()
+        return True
+    except Exception:
+        current_app.logger.exception("set_values(%r) failed", sorted(updates))
+        db.session.rollback()
+        return False
+
+
 def get_decrypted(key: str) -> Optional[str]:
     """Get decrypted value for a sensitive key. Convenience alias for get_value for backward compat."""
     return get_value(key)
@@ -161,11 +200,33 @@ def get_setting_or_env(key: str, default: Optional[str] = None) -> Optional[str]
     return os.environ.get(key, default)
 
 
+def get_settings_or_env(keys) -> dict:
+    """Bulk get_setting_or_env: resolve many keys with one AppSetting SELECT instead of one per key.
+    Returns {key: value or None} with the same DB-then-env precedence."""
+    keys = tuple(keys)
+    rows: dict = {}
+    wanted = [k for k in keys if k in ALLOWED_KEYS]
+    if wanted:
+        try:
+            from flask import current_app
+            from models.db import AppSetting
+            with current_app.app_context():
+                rows = {r.key: r.value for r in AppSetting.query.filter(AppSetting.key.in_(wanted)).all()}
+        except Exception:
+            rows = {}
+    out: dict = {}
+    for key in keys:
+        val = rows.get(key) if key in ALLOWED_KEYS else None
+        if val and key in SENSITIVE_KEYS:
+            val = decrypt_value(val)
+        out[key] = val if val else os.environ.get(key)
+    return out
+
+
 def get_all_for_api() -> dict:
     """Return dict for GET /api/settings: sensitive keys -> bool (is set), plain keys -> value or null. Requires app context."""
-    import sys
+    from flask import current_app
     try:
-        from flask import current_app
         from models.db import AppSetting
         with current_app.app_context():
             rows = {r.key: r.value for r in AppSetting.query.filter(AppSetting.key.in_(ALLOWED_KEYS)).all()}
@@ -176,10 +237,8 @@ def get_all_for_api() -> dict:
             else:
                 out[key] = rows.get(key) or None
         return out
-    except Exception as e:
-        print(f"[DEBUG] get_all_for_api exception: {type(e).__name__}: {e}", file=sys.stderr, flush=True)
-        import traceback
-        traceback.print_exc(file=sys.stderr)
+    except Exception:
+        current_app.logger.exception("get_all_for_api failed")
         raise
 
 
@@ -251,15 +310,16 @@ AGENT_ENV_KEYS = (
 def get_agent_env() -> dict:
     """All env vars the agent container needs, from Settings (DB) with env fallback. Used when building job payload."""
     out = dict(get_gh_env_for_agent())
+    settings = get_settings_or_env(AGENT_ENV_KEYS + ("openai_api_key",))
     for key in AGENT_ENV_KEYS:
         if key not in ALLOWED_KEYS:
             continue
-        val = get_setting_or_env(key) or os.environ.get(key)
+        val = settings[key]
         if val is not None and str(val).strip():
             out[key] = str(val).strip()
     # Map openai_api_key → OPENAI_API_KEY so the OpenAI SDK and embedding client
     # find it in the standard env var name inside the agent container.
-    openai_key = get_setting_or_env("openai_api_key") or os.environ.get("openai_api_key")
+    openai_key = settings["openai_api_key"]
     if openai_key and str(openai_key).strip():
         out["OPENAI_API_KEY"] = str(openai_key).strip()
     return out
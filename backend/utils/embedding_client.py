@@ -9,11 +9,16 @@ Settings (via Settings UI or env):
   MEMORY_EMBEDDING_MODEL — default model name, e.g. text-embedding-3-small.
 """
 import os
-from typing import List
+from functools import lru_cache
+from typing import List, Optional, Tuple
 
 import httpx
 from openai import OpenAI
 
+# Per-request timeout (seconds) for search-query embeddings: a stalled service should fail the search quickly
+# rather than pin the request for the client's 60s default.
+QUERY_EMBED_TIMEOUT_SEC = 5.0
+
 
 def _get_client() -> OpenAI:
     """Build an OpenAI client pointed at EMBEDDING_SERVICE_URL (or real OpenAI if unset)."""
@@ -57,20 +62,38 @@ def embed(
     texts: List[str],
     model_id: str = "",
     normalize: bool = True,
+    timeout: Optional[float] = None,
 ) -> List[List[float]]:
     """
     Embed one or more texts via an OpenAI-compatible /v1/embeddings endpoint.
     Returns a list of vectors (one list of floats per input text).
     normalize is accepted for interface compatibility but the service controls normalization.
+    timeout overrides the client's default for this request (raises openai.APITimeoutError when exceeded).
     """
     if not texts:
         return []
     model = (model_id or "").strip() or _default_model()
     client = _get_client()
-    response = client.embeddings.create(input=texts, model=model)
+    extra = {"timeout": timeout} if timeout else {}
+    response = client.embeddings.create(input=texts, model=model, **extra)
     return [item.embedding for item in response.data]
 
 
 def embed_single(text: str, model_id: str = "", normalize: bool = True) -> List[float]:
     """Convenience: embed a single string and return its vector."""
     return embed([text], model_id=model_id, normalize=normalize)[0]
+
+
+@lru_cache(maxsize=256)
+def _embed_query_cached(text: str, model: str) -> Tuple[float, ...]:
+    return tuple(embed([text], model_id=model, timeout=QUERY_EMBED_TIMEOUT_SEC)[0])
+
+
+def embed_query(text: str) -> List[float]:
+    """Embed a search query, memoized on (text, model) so repeated searches skip the embedding service."""
+    return list(_embed_query_cached(text, _default_model()))
+
+
+def clear_query_cache() -> None:
+    """Drop memoized query embeddings (call when EMBEDDING_SERVICE_URL or other embedding settings change)."""
+    _embed_query_cached.cache_clear()
@@ -22,6 +22,18 @@ def _get_hipporag():
             ) from e
     return _hipporag
 
+
+def preload() -> bool:
+    """Import HippoRAG ahead of the first memory request (call at app start, off the request path).
+    Otherwise the first index/retrieve pays the import while holding _cache_lock, stalling every project.
+    Returns False if it is unavailable; the request path then reports the error as before."""
+    try:
+        _get_hipporag()
+        return True
+    except RuntimeError:
+        return False
+
+
 _cache: Dict[str, tuple] = {}  # project_id -> (HippoRAG instance, threading.Lock)
 _cache_lock = threading.Lock()
 
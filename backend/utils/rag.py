@@ -2,17 +2,37 @@
 RAG embedding upsert: embed content and store in rag_embeddings for semantic search.
 Failures (e.g. embedding service down) are logged and skipped so create/update still succeeds.
 """
+import csv
+import io
+import json
+from typing import Iterable, List, Tuple
 from uuid import UUID
 
 from flask import current_app
+from sqlalchemy import tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
-from models.db import db, RAGEmbedding
-from utils.embedding_client import embed_single
+from models.db import db, Note, RAGEmbedding
+from utils.embedding_client import embed, embed_single
+
+# Inputs per embeddings request; OpenAI-compatible servers cap the batch size (OpenAI: 2048).
+EMBED_BATCH_SIZE = 256
+# At or above this many rows, load through COPY into a staging table instead of one multi-row INSERT
+# (which binds 5 parameters per row and would hit Postgres' 65535-parameter cap around 13k rows).
+COPY_MIN_ROWS = 500
 
 
 def upsert_embedding(project_id: UUID, source_type: str, source_id: UUID, content: str) -> None:
-    """Replace existing RAG row for this source with a new embedding; no-op if content is blank."""
+    """Replace existing RAG row for this source with a new embedding; removes the row if content is blank.
+    Skips the embedding call when the stored content is unchanged (e.g. a ticket moved between columns)."""
     content = (content or "").strip()
+    if content:
+        # Column-only select: the ORM must never load the pgvector embedding column
+        stored = db.session.query(RAGEmbedding.content).filter_by(
+            project_id=project_id, source_type=source_type, source_id=source_id
+        ).scalar()
+        if stored == content:
+            return
     RAGEmbedding.query.filter_by(
         project_id=project_id, source_type=source_type, source_id=source_id
     ).delete()
@@ -36,9 +56,135 @@ def upsert_embedding(project_id: UUID, source_type: str, source_id: UUID, conten
     db.session.commit()
 
 
+def upsert_note_embedding(project_id: UUID, note_id: UUID, content: str) -> None:
+    """upsert_embedding for a note that may be deleted concurrently (background refresh). The row is written in
+    the same transaction that share-locks the note, so the write only lands while the note exists: a note DELETE
+    (note row first, then its embeddings, one transaction) either waits for this commit and removes the new row,
+    or wins the lock and leaves nothing to write. The embedding call runs before the lock is taken."""
+    content = (content or "").strip()
+    if not content:
+        return
+    stored = db.session.query(RAGEmbedding.content).filter_by(
+        project_id=project_id, source_type="note", source_id=note_id
+    ).scalar()
+    if stored == content:
+        return
+    try:
+        vector = embed_single(content)
+    except Exception as e:
+        current_app.logger.warning("RAG embed skipped for note %s: %s", note_id, e)
+        db.session.rollback()
+        return
+    exists = (
+        db.session.query(Note.id)
+        .filter_by(project_id=project_id, id=note_id)
+        .with_for_update(read=True)
+        .first()
+    )
+    if exists is None:
+        db.session.rollback()
+        return
+    stmt = pg_insert(RAGEmbedding.__table__).values(
+        project_id=project_id, source_type="note", source_id=note_id, content=content, embedding=vector
+    )
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=["project_id", "source_type", "source_id"],
+        set_={"content": stmt.excluded.content, "embedding": stmt.excluded.embedding},
+    ))
+    db.session.commit()
+
+
+def upsert_embeddings_bulk(project_id: UUID, items: Iterable[Tuple[str, UUID, str]]) -> None:
+    """Embed (source_type, source_id, content) items in batched requests and upsert them in one statement
+    (a COPY-loaded staging table for large batches).
+    Blank content is skipped; later duplicates of a source win. Sources whose stored content is unchanged are
+    not re-embedded, so a graph save embeds only what was edited. On embedding failure existing rows are kept."""
+    by_source = {}
+    for source_type, source_id, content in items:
+        content = (content or "").strip()
+        if content:
+            by_source[(source_type, source_id)] = content
+    if not by_source:
+        return
+    # Column-only select of the stored text for these source types (one query, no per-source binds)
+    stored = db.session.query(RAGEmbedding.source_type, RAGEmbedding.source_id, RAGEmbedding.content).filter(
+        RAGEmbedding.project_id == project_id,
+        RAGEmbedding.source_type.in_({source_type for source_type, _ in by_source}),
+    ).all()
+    for source_type, source_id, content in stored:
+        if by_source.get((source_type, source_id)) == content:
+            del by_source[(source_type, source_id)]
+    if not by_source:
+        return
+    keys = list(by_source)
+    contents = [by_source[k] for k in keys]
+    try:
+        vectors = []
+        for start in range(0, len(contents), EMBED_BATCH_SIZE):
+            vectors.extend(embed(contents[start:start + EMBED_BATCH_SIZE]))
+    except Exception as e:
+        current_app.logger.warning("RAG bulk embed skipped for %d item(s): %s", len(contents), e)
+        return
+    if len(keys) >= COPY_MIN_ROWS:
+        _copy_upsert(project_id, keys, contents, vectors)
+    else:
+        rows = [
+            {
+                "project_id": project_id,
+                "source_type": source_type,
+                "source_id": source_id,
+                "content": content,
+                "embedding": vector,
+            }
+            for (source_type, source_id), content, vector in zip(keys, contents, vectors)
+        ]
+        stmt = pg_insert(RAGEmbedding.__table__).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["project_id", "source_type", "source_id"],
+            set_={"content": stmt.excluded.content, "embedding": stmt.excluded.embedding},
+        )
+        db.session.execute(stmt)
+    db.session.commit()
+
+
+def _copy_upsert(project_id: UUID, keys: List[Tuple[str, UUID]], contents: List[str], vectors: List[List[float]]) -> None:
+    """COPY rows (CSV; vectors in pgvector's text form) into a temp table, then upsert from it in one statement.
+    Runs on the session's connection, inside its transaction; the caller commits (which drops the table)."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for (source_type, source_id), content, vector in zip(keys, contents, vectors):
+        writer.writerow((str(project_id), source_type, str(source_id), content, json.dumps(vector, separators=(",", ":"))))
+    buf.seek(0)
+    raw_conn = db.session.connection().connection
+    with raw_conn.cursor() as cur:
+        cur.execute(
+            "CREATE TEMP TABLE rag_stage (project_id uuid, source_type varchar(50), source_id uuid, "
+            "content text, embedding halfvec) ON COMMIT DROP"
+        )
+        cur.copy_expert("COPY rag_stage FROM STDIN WITH (FORMAT csv)", buf)
+        cur.execute(
+            "INSERT INTO rag_embeddings (project_id, source_type, source_id, content, embedding) "
+            "SELECT project_id, source_type, source_id, content, embedding FROM rag_stage "
+            "ON CONFLICT (project_id, source_type, source_id) "
+            "DO UPDATE SET content = EXCLUDED.content, embedding = EXCLUDED.embedding"
+        )
+
+
 def delete_embeddings_for_source(project_id: UUID, source_type: str, source_id: UUID) -> None:
     """Remove all RAG rows for the given source."""
     RAGEmbedding.query.filter_by(
         project_id=project_id, source_type=source_type, source_id=source_id
     ).delete()
     db.session.commit()
+
+
+def delete_embeddings_for_sources(project_id: UUID, sources: Iterable[Tuple[str, UUID]]) -> None:
+    """Remove all RAG rows for many (source_type, source_id) pairs with one DELETE."""
+    sources = list(dict.fromkeys(sources))
+    if not sources:
+        return
+    RAGEmbedding.query.filter(
+        RAGEmbedding.project_id == project_id,
+        tuple_(RAGEmbedding.source_type, RAGEmbedding.source_id).in_(sources),
+    ).delete(synchronize_session=False)
+    db.session.commit()
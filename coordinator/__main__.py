@@ -13,11 +13,11 @@ AGENT_DOCKER_MODE: "dind" (default) — run --privileged with an isolated docker
 import json
 import os
 import platform
+import queue
 import shlex
 import subprocess
 import sys
 import threading
-import time
 from pathlib import Path
 from typing import Dict, List, Optional
 
@@ -342,6 +342,14 @@ def _run_job(base_url: str, job_id: str, job: dict, default_image: str, project_
         mark_fail(base_url, job_id)
 
 
+def _run_job_and_report(done: "queue.Queue[threading.Thread]", *args) -> None:
+    """Thread target: run the job, then report this thread on done so main() can refill the slot at once."""
+    try:
+        _run_job(*args)
+    finally:
+        done.put(threading.current_thread())
+
+
 def main() -> None:
     project_ids = _project_ids()
     base_url = _base_url()
@@ -351,6 +359,7 @@ def main() -> None:
     poll_interval = float(_env("POLL_INTERVAL_SEC", "10") or "10")
 
     running: List[threading.Thread] = []
+    done: "queue.Queue[threading.Thread]" = queue.Queue()
     docker_mode = _env("AGENT_DOCKER_MODE", "dind").lower()
     scope = f"projects={project_ids}" if project_ids else "all projects"
     # Fetch initial value (may differ from env if already set in the UI)
@@ -383,14 +392,18 @@ def main() -> None:
             print(f"[coordinator] claimed job {job_id} (ticket={job.get('ticket_id')}, kind={job.get('kind')})", flush=True)
             project_images = _load_project_images()
             t = threading.Thread(
-                target=_run_job,
-                args=(base_url, job_id, job, default_image, project_images),
+                target=_run_job_and_report,
+                args=(done, base_url, job_id, job, default_image, project_images),
                 daemon=False,
             )
             t.start()
             running.append(t)
 
-        time.sleep(poll_interval)
+        # Wait for the next poll, or wake as soon as a running job finishes so its slot is refilled
+        try:
+            done.get(timeout=poll_interval).join()
+        except queue.Empty:
+            pass
 
 
 if __name__ == "__main__":
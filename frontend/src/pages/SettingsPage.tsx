@@ -72,6 +72,7 @@ const EMBEDDING_PROVIDER_LABELS: Record<EmbeddingProvider, string> = {
 const FIELDS: FieldMeta[] = [
   // GitHub
   { key: 'github_agent_token', label: 'GitHub token', hint: 'Used by the agent (push branches, create PRs, reply to PR comments) and the UI (PR polling, approve, merge). Classic PAT with repo scope.', sensitive: true, required: true },
+  { key: 'GITHUB_WEBHOOK_SECRET', label: 'GitHub webhook secret', hint: 'Optional. Secret of a repo webhook pointed at /api/webhooks/github (pull_request, pull_request_review, pull_request_review_comment, issue_comment). When set, review comments are picked up on arrival and the background poll drops to hourly.', sensitive: true },
   { key: 'GIT_USER_NAME', label: 'Git name', hint: 'Author name for agent commits. No default — e.g. "My Agent".', sensitive: false, required: true },
   { key: 'GIT_USER_EMAIL', label: 'Git email', hint: 'Author email for agent commits. No default — e.g. agent@myorg.com.', sensitive: false, required: true },
   // Director LLM
@@ -108,7 +109,7 @@ const FIELDS: FieldMeta[] = [
 ];
 
 const SECTIONS: { title: string; keys: string[]; description?: string }[] = [
-  { title: 'GitHub', keys: ['github_agent_token', 'GIT_USER_NAME', 'GIT_USER_EMAIL'], description: 'One token and git identity for all GitHub actions: agent pushes/PRs, PR comment replies, UI polling, approve, and merge.' },
+  { title: 'GitHub', keys: ['github_agent_token', 'GITHUB_WEBHOOK_SECRET', 'GIT_USER_NAME', 'GIT_USER_EMAIL'], description: 'One token and git identity for all GitHub actions: agent pushes/PRs, PR comment replies, UI polling, approve, and merge.' },
   { title: 'Director', keys: ['AGENT_PROVIDER', 'AGENT_LLM_URL', 'AGENT_MODEL', 'AGENT_API_KEY', 'MIDDLE_AGENT_DEBUG'], description: 'The Director LLM orchestrates the agent — assessing progress, interpreting results, and deciding next steps.' },
   { title: 'Worker', keys: ['WORKER_MODE', 'WORKER_LLM_URL', 'WORKER_MODEL', 'WORKER_API_KEY', 'WORKER_TIMEOUT_SEC'], description: 'Worker used inside the agent container. Claude Code (default) runs the claude CLI headless; OpenCode uses an LLM via HTTP.' },
   { title: 'Embeddings', keys: ['EMBEDDING_PROVIDER', 'EMBEDDING_SERVICE_URL', 'MEMORY_EMBEDDING_MODEL', 'EMBEDDING_API_KEY', 'openai_api_key'], description: 'Used for ticket/graph search and HippoRAG memory indexing.' },
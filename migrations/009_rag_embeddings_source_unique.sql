@@ -0,0 +1,11 @@
+-- rag_embeddings: one row per (project, source) so bulk upserts can use ON CONFLICT.
+-- Drop duplicates left by earlier delete-then-insert upserts, keeping the newest row.
+DELETE FROM rag_embeddings a
+USING rag_embeddings b
+WHERE a.project_id = b.project_id
+  AND a.source_type = b.source_type
+  AND a.source_id = b.source_id
+  AND (a.created_at, a.id::text) < (b.created_at, b.id::text);
+
+CREATE UNIQUE INDEX IF NOT EXISTS _rag_embedding_source_uniq
+    ON rag_embeddings(project_id, source_type, source_id);
@@ -0,0 +1,3 @@
+-- Board loads and the PR poller filter tickets by project and column together.
+-- prs(ticket_id) is already indexed by 001 (idx_prs_ticket_id).
+CREATE INDEX IF NOT EXISTS idx_tickets_project_column ON tickets(project_id, column_id);
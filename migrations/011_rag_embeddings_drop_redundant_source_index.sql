@@ -0,0 +1,4 @@
+-- 009's unique index on (project_id, source_type, source_id) now serves project-scoped deletes and the
+-- graph PUT stale-row anti-join; the older (source_type, source_id) index is covered by it for lookups
+-- that also filter by project, which all of ours do.
+DROP INDEX IF EXISTS idx_rag_embeddings_source;
@@ -0,0 +1,21 @@
+-- agent_jobs: at most one pending/running job per (ticket, kind), enforced by the DB so concurrent
+-- enqueues (several backend workers, poller + UI) cannot both insert.
+-- agent_jobs is created by the app (db.create_all) on first start, so only act if it already exists;
+-- on a fresh DB the model's __table_args__ creates the same index.
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'agent_jobs') THEN
+    -- Keep the oldest active job per (ticket, kind); fail the extra ones so the index can be built.
+    UPDATE agent_jobs SET status = 'failed'
+    WHERE id IN (
+      SELECT id FROM (
+        SELECT id, row_number() OVER (PARTITION BY ticket_id, kind ORDER BY created_at, id) AS rn
+        FROM agent_jobs
+        WHERE status IN ('pending', 'running')
+      ) ranked
+      WHERE rn > 1
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS _agent_job_active_uniq
+      ON agent_jobs(ticket_id, kind) WHERE status IN ('pending', 'running');
+  END IF;
+END $$;
@@ -0,0 +1,24 @@
+-- notes.node_id / edge_id: comma-separated TEXT -> TEXT[] so links are stored as lists and
+-- "notes referencing node X" can use a GIN containment lookup (node_id @> ARRAY['X']).
+-- Graph node/edge ids are client-chosen strings, not UUIDs, hence TEXT[].
+-- Idempotent: only converts columns that are still TEXT.
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1 FROM information_schema.columns
+    WHERE table_name = 'notes' AND column_name = 'node_id' AND data_type = 'text'
+  ) THEN
+    ALTER TABLE notes ALTER COLUMN node_id TYPE TEXT[] USING
+      NULLIF(array_remove(string_to_array(regexp_replace(btrim(node_id), '\s*,\s*', ',', 'g'), ','), ''), '{}');
+  END IF;
+  IF EXISTS (
+    SELECT 1 FROM information_schema.columns
+    WHERE table_name = 'notes' AND column_name = 'edge_id' AND data_type = 'text'
+  ) THEN
+    ALTER TABLE notes ALTER COLUMN edge_id TYPE TEXT[] USING
+      NULLIF(array_remove(string_to_array(regexp_replace(btrim(edge_id), '\s*,\s*', ',', 'g'), ','), ''), '{}');
+  END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS idx_notes_node_id_gin ON notes USING gin(node_id);
+CREATE INDEX IF NOT EXISTS idx_notes_edge_id_gin ON notes USING gin(edge_id);
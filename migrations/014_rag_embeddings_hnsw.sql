@@ -0,0 +1,3 @@
+-- HNSW index for rag_search's ORDER BY embedding <-> :vec (L2), replacing a scan of every row in the project.
+CREATE INDEX IF NOT EXISTS idx_rag_embeddings_embedding_hnsw
+    ON rag_embeddings USING hnsw (embedding vector_l2_ops) WITH (m = 16, ef_construction = 64);
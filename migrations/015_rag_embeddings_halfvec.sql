@@ -0,0 +1,6 @@
+-- Store RAG embeddings as halfvec (16-bit floats, pgvector >= 0.7): halves row and HNSW index size so the
+-- index stays cache-resident; recall loss for text embeddings at this precision is negligible.
+DROP INDEX IF EXISTS idx_rag_embeddings_embedding_hnsw;
+ALTER TABLE rag_embeddings ALTER COLUMN embedding TYPE halfvec(768) USING embedding::halfvec(768);
+CREATE INDEX IF NOT EXISTS idx_rag_embeddings_embedding_hnsw
+    ON rag_embeddings USING hnsw (embedding halfvec_l2_ops) WITH (m = 16, ef_construction = 64);
@@ -0,0 +1,3 @@
+-- tickets.cancel_requested_at: set by the UI cancel action, polled by the running agent via
+-- GET .../cancel-requested. Persisted so it survives restarts and is shared by all backend processes.
+ALTER TABLE tickets ADD COLUMN IF NOT EXISTS cancel_requested_at TIMESTAMP WITH TIME ZONE;
@@ -0,0 +1,5 @@
+-- Ticket log view filters execution_logs by project and ticket and orders by created_at;
+-- the compound index serves it as an ordered range scan instead of filter + sort.
+-- agent_jobs enqueue checks are already covered by _agent_job_active_uniq (012).
+CREATE INDEX IF NOT EXISTS idx_execution_logs_project_ticket_created
+  ON execution_logs(project_id, ticket_id, created_at);
@@ -0,0 +1,13 @@
+-- agent_jobs: workers claim the oldest pending job (optionally for one project) on every poll.
+-- Partial indexes keep only pending rows, so the claim reads the head of a small index instead of scanning.
+-- agent_jobs is created by the app (db.create_all) on first start, so only act if it already exists;
+-- on a fresh DB the model's __table_args__ creates the same indexes.
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'agent_jobs') THEN
+    CREATE INDEX IF NOT EXISTS idx_agent_jobs_pending
+      ON agent_jobs(created_at) WHERE status = 'pending';
+    CREATE INDEX IF NOT EXISTS idx_agent_jobs_project_pending
+      ON agent_jobs(project_id, created_at) WHERE status = 'pending';
+  END IF;
+END $$;